@@ -0,0 +1,40 @@
+"""
+JWT-аутентификация без запроса пользователя к базе.
+
+Пользователь запроса - экземпляр CustomUser, собранный из claims токена
+(tokens.py): id, username, is_staff и is_superuser загружены, остальные поля
+отложены и подгружаются из базы при первом обращении, как у .only(). С ним
+работают фильтры и внешние ключи (Work(user=request.user)), а эндпоинтам,
+которым нужна вся строка, хватает обычного доступа к полю.
+
+Токены без claims (выданные до включения режима) проверяются как раньше,
+с загрузкой пользователя.
+"""
+from django.contrib.auth import get_user_model
+from django.db import router
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .tokens import USER_CLAIMS
+
+
+def user_from_claims(token):
+    User = get_user_model()
+    data = {claim: token[claim] for claim in USER_CLAIMS}
+    # simplejwt пишет ID строкой
+    id_field = User._meta.get_field(api_settings.USER_ID_FIELD)
+    data[id_field.attname] = id_field.to_python(token[api_settings.USER_ID_CLAIM])
+    # Токены отключенным пользователям не выдаются и не обновляются
+    data["is_active"] = True
+    # from_db ждет значения в порядке полей модели
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in data]
+    return User.from_db(router.db_for_read(User), field_names, [data[name] for name in field_names])
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token or any(
+            claim not in validated_token for claim in USER_CLAIMS
+        ):
+            return super().get_user(validated_token)
+        return user_from_claims(validated_token)
@@ -1,3 +1,72 @@
+from datetime import timedelta
+
+from django.core.cache import caches
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from main_app.models import Object, Work
+from .authentication import user_from_claims
+from .models import CustomUser
+from .tokens import ClaimsRefreshToken
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("boss", password="x", is_staff=True)
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post(
+            "/api/v1/auth/login/", {"username": "boss", "password": "x"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_status_and_ping_make_no_queries(self):
+        access = self.login()["access_token"]
+        self.assertTrue(AccessToken(access)["is_staff"])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/v1/auth/status/").data, {"status": "staff"})
+            self.assertEqual(self.client.get("/api/v1/auth/ping/").status_code, 200)
+
+    def test_token_user_loads_other_fields_lazily(self):
+        self.user.email = "boss@example.com"
+        self.user.save()
+        user = user_from_claims(ClaimsRefreshToken.for_user(self.user).access_token)
+        with self.assertNumQueries(0):
+            self.assertEqual((user.pk, user.username, user.is_staff), (self.user.pk, "boss", True))
+            self.assertEqual(user, self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "boss@example.com")
+
+    def test_refresh_reloads_claims(self):
+        refresh = self.login()["refresh_token"]
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.post("/api/v1/auth/refresh/", {"refresh_token": refresh}, format="json")
+        self.assertFalse(AccessToken(response.data["access_token"])["is_staff"])
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.post("/api/v1/auth/refresh/", {"refresh_token": refresh}, format="json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_without_claims_loads_user(self):
+        access = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get("/api/v1/auth/status/").data, {"status": "staff"})
 
-# Create your tests here.
+    def test_token_user_is_used_as_foreign_key(self):
+        caches["active_work"].clear()
+        obj = Object.objects.create(
+            name="Объект", address="Адрес", task_description="Задача",
+            deadline=timezone.now() + timedelta(days=1), supervisor=self.user,
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login()['access_token']}")
+        response = self.client.post("/api/v1/start/", {"object": obj.id, "name": "Работа"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Work.objects.get(id=response.data["work_id"]).user_id, self.user.id)
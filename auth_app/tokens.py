@@ -0,0 +1,42 @@
+"""
+Токены с данными пользователя в claims.
+
+В access-токен кладутся username, is_staff и is_superuser, чтобы
+ClaimsJWTAuthentication собирала пользователя запроса без запроса к базе.
+Claims обновляются из базы при каждом refresh, поэтому снятые права и
+отключенный пользователь действуют не дольше ACCESS_TOKEN_LIFETIME.
+"""
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+USER_CLAIMS = ("username", "is_staff", "is_superuser")
+
+
+def add_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+class ClaimsRefreshToken(RefreshToken):
+    @classmethod
+    def for_user(cls, user):
+        # access_token копирует claims из refresh-токена
+        return add_claims(super().for_user(user), user)
+
+
+def refresh_access_token(refresh):
+    """
+    Новый access-токен с claims из текущей строки пользователя или None,
+    если пользователь удален или отключен
+    """
+    user = (
+        get_user_model()
+        .objects.filter(**{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}, is_active=True)
+        .only(*USER_CLAIMS)
+        .first()
+    )
+    if user is None:
+        return None
+    return add_claims(refresh.access_token, user)
@@ -11,6 +11,7 @@ from django.contrib.auth import authenticate
 from rest_framework import serializers
 
 from .serializers import RegisterSerializer, LoginSerializer, PingSerializer, RefreshTokenSerializer, LogoutSerializer
+from .tokens import ClaimsRefreshToken, refresh_access_token
 
 
 
@@ -52,7 +53,7 @@ class LoginView(APIView):
             user = authenticate(username=serializer.validated_data['username'], password=serializer.validated_data['password'])
             if user:
                 print("FLAG3")
-                refresh = RefreshToken.for_user(user)
+                refresh = ClaimsRefreshToken.for_user(user)
                 return Response({   
                     'access_token': str(refresh.access_token),
                     'refresh_token': str(refresh),
@@ -69,6 +70,7 @@ class RefreshTokenView(APIView):
         responses={
             200: "Успешное обновление токенов",
             400: "Неверный refresh токен",
+            401: "Пользователь удален или отключен",
         }
     )
 
@@ -80,12 +82,15 @@ class RefreshTokenView(APIView):
         try:
 
             refresh = RefreshToken(refresh_token)
-
-            access_token = str(refresh.access_token)
-            return Response({"access_token": access_token}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": "Invalid refresh token"}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Claims берутся из базы, а не из refresh-токена: снятые права не живут дольше access-токена
+        access_token = refresh_access_token(refresh)
+        if access_token is None:
+            return Response({"error": "User not found or inactive"}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response({"access_token": str(access_token)}, status=status.HTTP_200_OK)
+
 
 class PingView(APIView):
     permission_classes = [IsAuthenticated]
@@ -13,6 +13,8 @@ import os
 from pathlib import Path
 from datetime import timedelta
 
+from django.core.exceptions import ImproperlyConfigured
+
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -60,11 +62,16 @@ CORS_ALLOWED_ORIGINS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Пользователь из claims токена без запроса к базе (auth_app/authentication.py).
+        # Вернуть загрузку пользователя на каждый запрос -
+        # 'rest_framework_simplejwt.authentication.JWTAuthentication'
+        'auth_app.authentication.ClaimsJWTAuthentication',
     ],
 }
 
 SIMPLE_JWT = {
+    # Права из claims (is_staff, is_superuser) и отключение пользователя
+    # вступают в силу не позже, чем через время жизни access-токена
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'BLACKLIST_AFTER_ROTATION': True,
@@ -82,6 +89,142 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
 }
 
+# Максимальное число событий в одном запросе /api/v1/sync/
+SYNC_MAX_EVENTS = 200
+# Окно офлайн-работы: время начала и завершения от клиента (события sync/)
+# не может быть старше, более ранние события отклоняются
+SYNC_MAX_EVENT_AGE = timedelta(days=3)
+
+# Кэш открытой работы пользователя (статус объекта и начало работы).
+# LocMemCache живет внутри процесса и подходит только для сервера из одного
+# процесса (runserver в docker-compose): сброс в одном процессе не виден
+# другим, поэтому срок кэша короткий. При нескольких процессах или хостах
+# нужен общий бэкенд - FileBasedCache (один хост), Redis или DatabaseCache,
+# manage.py check --deploy напоминает об этом (main_app.W001)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "active_work": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "active_work",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+ACTIVE_WORK_CACHE = "active_work"
+ACTIVE_WORK_CACHE_TIMEOUT = 30
+
+# Кэш множества объектов, доступных пользователю (None - без кэша,
+# каждая проверка - один EXISTS-запрос)
+OBJECT_ACCESS_CACHE = "default"
+OBJECT_ACCESS_CACHE_TIMEOUT = 300
+
+# Keyset-пагинация списков работ и изображений (параметры cursor, page_size)
+KEYSET_PAGE_SIZE = 50
+KEYSET_MAX_PAGE_SIZE = 200
+
+# Размер пачки работ при потоковой выгрузке истории объекта
+EXPORT_CHUNK_SIZE = 500
+
+# Уменьшенные копии фото работ: имя -> максимальная сторона в пикселях
+IMAGE_RENDITIONS = {"thumb": 200, "medium": 1024}
+IMAGE_RENDITIONS_QUALITY = 82
+IMAGE_RENDITIONS_WORKERS = 2
+# False - копии делаются сразу после коммита в том же процессе запроса
+IMAGE_RENDITIONS_ASYNC = True
+
+# Пережатие загружаемых фото: поворот по EXIF, удаление EXIF кроме времени
+# съемки, уменьшение до MAX_DIMENSION и кодирование в JPEG или WEBP
+IMAGE_COMPRESSION_ENABLED = False
+IMAGE_COMPRESSION_MAX_DIMENSION = 2560
+IMAGE_COMPRESSION_FORMAT = "JPEG"
+IMAGE_COMPRESSION_QUALITY = 80
+
+# Файлы фото через /api/v1/image_work/{work_id}/{image_id}/file/: за nginx
+# Django только проверяет права, файл отдает nginx по X-Accel-Redirect
+# из internal-локации (см. docker_compose/nginx.conf)
+MEDIA_ACCEL_REDIRECT = os.environ.get("MEDIA_ACCEL_REDIRECT") == "1"
+MEDIA_ACCEL_REDIRECT_PREFIX = "/protected_media/"
+
+# Подписанные ссылки на фото /api/v1/media/...: срок действия и интервал,
+# в пределах которого ссылка не меняется (для кэша браузера и прокси)
+MEDIA_URL_TTL = 60 * 60
+MEDIA_URL_BUCKET = 15 * 60
+
+# Раскладка фото по каталогам: "hash" (images/ab/<sha256>.jpg) или
+# "date" (images/2025/01/31/<sha256>.jpg). После смены - relocate_media
+MEDIA_PATH_STRATEGY = "hash"
+
+# Проверка фото при приеме (upload_handlers.py): размер файла, форматы по
+# сигнатуре и число пикселей по заголовку, до декодирования
+UPLOAD_IMAGE_MAX_SIZE = 45 * 1024 * 1024
+UPLOAD_IMAGE_FORMATS = ("JPEG", "PNG", "WEBP", "GIF")
+UPLOAD_IMAGE_MAX_PIXELS = 50_000_000
+
+# QR-коды объектов: содержимое, параметры кодирования и кэш готовых картинок.
+# {code} - подписанный код объекта, {id} - его ID
+QR_PAYLOAD_TEMPLATE = "{code}"
+# Ключи подписи кодов по версиям. Новая версия - добавить ключ, переключить
+# QR_SIGNING_KEY_VERSION и запустить rerender_qr_codes; удаление версии
+# отзывает все ее коды. Ключ свой, не SECRET_KEY: наклейки напечатаны, и
+# смена SECRET_KEY не должна их отзывать. Без DEBUG ключ из окружения
+# обязателен: ключ по умолчанию лежит в репозитории и годится только для
+# разработки (manage.py check --deploy тоже на него укажет)
+qr_signing_key = os.environ.get("QR_SIGNING_KEY")
+if not qr_signing_key:
+    if not DEBUG:
+        raise ImproperlyConfigured("Не задана переменная окружения QR_SIGNING_KEY")
+    qr_signing_key = "django-insecure-qr-7f3c1a9e5b2d4c8a"
+QR_SIGNING_KEYS = {1: qr_signing_key}
+QR_SIGNING_KEY_VERSION = 1
+# Требовать подписанный код (?code= / поле code) в статусе объекта и начале
+# работы, в том числе в событиях start из sync/. Пакетный статус
+# object/status/batch/ (панель прораба) от кода освобожден
+QR_SIGNED_CODES_REQUIRED = False
+QR_ERROR_LEVEL = "M"
+QR_BORDER = 4
+QR_DEFAULT_SIZE = 300
+QR_MIN_SIZE = 64
+QR_MAX_SIZE = 2048
+QR_CACHE_DIR = os.path.join(BASE_DIR, "qr_cache")
+QR_CACHE_MAX_AGE = 24 * 60 * 60
+
+# Листы QR-наклеек для печати (A4): разрешение, сетка и шрифт с кириллицей
+QR_SHEET_DPI = 200
+QR_SHEET_COLUMNS = 3
+QR_SHEET_ROWS = 4
+QR_SHEET_FONT = "DejaVuSans.ttf"
+# Сколько страниц можно напечатать действием админки, дальше - render_qr_sheets.
+# Столько же объектов (страницы x сетка) за раз в действии «Сгенерировать
+# QR-коды», дальше - rerender_qr_codes
+QR_SHEET_ADMIN_MAX_PAGES = 5
+
+# Проверка QR-кода объекта на загруженных фото (photo_qr.py): коды ищутся
+# на серой копии со стороной не больше MAX_SIZE в пуле процессов, результат -
+# WorkImage.qr_check. Старые фото - verify_photo_qr
+QR_PHOTO_VERIFICATION_ENABLED = os.environ.get("QR_PHOTO_VERIFICATION_ENABLED") == "1"
+QR_PHOTO_VERIFICATION_MAX_SIZE = 1600
+QR_PHOTO_VERIFICATION_WORKERS = 2
+# Способ запуска процессов пула: forkserver или spawn, не fork многопоточного сервера
+QR_PHOTO_VERIFICATION_START_METHOD = "forkserver"
+# False - проверка сразу после коммита в процессе запроса
+QR_PHOTO_VERIFICATION_ASYNC = True
+
+# Максимальное число файлов в /api/v1/image_work/{work_id}/batch/
+IMAGE_BATCH_MAX_FILES = 30
+
+# Докачиваемые загрузки фото: временные файлы, лимиты и срок жизни сессии
+UPLOAD_SESSIONS_DIR = os.path.join(BASE_DIR, "upload_sessions")
+UPLOAD_SESSION_MAX_SIZE = 45 * 1024 * 1024
+UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024
+UPLOAD_SESSION_TTL = timedelta(hours=24)
+
+# Максимальное число объектов в /api/v1/object/status/batch/
+STATUS_BATCH_MAX_OBJECTS = 500
+
+# Сколько хранится ответ на запрос с заголовком Idempotency-Key
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
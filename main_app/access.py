@@ -0,0 +1,115 @@
+"""
+Доступ пользователя к объекту: прораб объекта или назначенный работник.
+
+Проверка назначения - EXISTS по индексу промежуточной таблицы Object.worker,
+без загрузки всех работников объекта. Дополнительно можно включить кэш
+множества доступных пользователю объектов (OBJECT_ACCESS_CACHE), он
+сбрасывается при изменении назначений и прораба объекта.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Object
+
+ObjectWorker = Object.worker.through
+
+
+def is_worker(user, object_ref=OuterRef("pk")):
+    """Выражение EXISTS: пользователь назначен на объект object_ref"""
+    return Exists(
+        ObjectWorker.objects.filter(object_id=object_ref, customuser_id=user.id)
+    )
+
+
+def access_q(user):
+    return Q(supervisor_id=user.id) | Q(is_worker(user))
+
+
+def annotate_access(queryset, user):
+    """Добавляет объектам признак назначения is_worker в том же запросе"""
+    return queryset.annotate(is_worker=is_worker(user))
+
+
+def has_access(user, obj):
+    """Для объекта из annotate_access"""
+    return obj.is_worker or obj.supervisor_id == user.id
+
+
+def can_view_work(user, owner_id):
+    """Работу и ее фото видят исполнитель работы и администраторы"""
+    return user.is_staff or user.is_superuser or owner_id == user.id
+
+
+def get_cache():
+    alias = settings.OBJECT_ACCESS_CACHE
+    return caches[alias] if alias else None
+
+
+def cache_key(user_id):
+    return f"object_access:{user_id}"
+
+
+def accessible_object_ids(user):
+    """Множество ID объектов, доступных пользователю"""
+    cache = get_cache()
+    if cache is not None:
+        cached = cache.get(cache_key(user.id))
+        if cached is not None:
+            return cached
+    object_ids = frozenset(
+        Object.objects.filter(access_q(user)).values_list("id", flat=True)
+    )
+    if cache is not None:
+        cache.set(cache_key(user.id), object_ids, timeout=settings.OBJECT_ACCESS_CACHE_TIMEOUT)
+    return object_ids
+
+
+def can_access_object(user, object_id):
+    """
+    Может ли пользователь работать с объектом. С включенным кэшем отвечает без
+    запросов, иначе одним EXISTS-запросом
+    """
+    if get_cache() is not None:
+        return object_id in accessible_object_ids(user)
+    return Object.objects.filter(pk=object_id).filter(access_q(user)).exists()
+
+
+def invalidate(*user_ids):
+    cache = get_cache()
+    if cache is not None:
+        cache.delete_many([cache_key(user_id) for user_id in user_ids if user_id])
+
+
+@receiver(m2m_changed, sender=ObjectWorker)
+def invalidate_on_workers_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        # После очистки уже не узнать, кто был назначен
+        if reverse:
+            invalidate(instance.pk)
+        else:
+            invalidate(*instance.worker.values_list("id", flat=True))
+    elif action in ("post_add", "post_remove"):
+        if reverse:
+            invalidate(instance.pk)
+        else:
+            invalidate(*(pk_set or ()))
+
+
+@receiver(pre_save, sender=Object)
+def invalidate_on_supervisor_change(sender, instance, **kwargs):
+    if instance.pk is None or get_cache() is None:
+        return
+    old_supervisor_id = (
+        Object.objects.filter(pk=instance.pk).values_list("supervisor_id", flat=True).first()
+    )
+    if old_supervisor_id != instance.supervisor_id:
+        invalidate(old_supervisor_id)
+
+
+@receiver(post_save, sender=Object)
+@receiver(post_delete, sender=Object)
+def invalidate_supervisor(sender, instance, **kwargs):
+    invalidate(instance.supervisor_id)
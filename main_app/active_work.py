@@ -0,0 +1,88 @@
+"""
+Кэш текущей незавершенной работы пользователя.
+
+Используется статусом объекта и началом работы. Алиас кэша задается
+настройкой ACTIVE_WORK_CACHE. Сбрасывается явно из Work.start_work и
+Work.end_work и при любом сохранении или удалении Work (сигналы в
+models.py), но только в том кэше, который видит процесс: при нескольких
+процессах сервера бэкенд должен быть общим (FileBasedCache, Redis,
+DatabaseCache). С LocMemCache другой процесс может до истечения
+ACTIVE_WORK_CACHE_TIMEOUT считать открытой уже закрытую работу.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.apps import apps
+from django.db import transaction
+
+NO_WORK = "none"  # у пользователя нет открытой работы (None означает промах)
+HITS_KEY = "active_work:hits"
+MISSES_KEY = "active_work:misses"
+
+
+def get_cache():
+    return caches[settings.ACTIVE_WORK_CACHE]
+
+
+def cache_key(user_id):
+    return f"active_work:{user_id}"
+
+
+def count(key):
+    cache = get_cache()
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Счетчик вытеснили между add и incr
+        cache.set(key, 1, timeout=None)
+
+
+def peek(user_id):
+    """Значение из кэша без обращения к базе: (найдено, работа или None)"""
+    cached = get_cache().get(cache_key(user_id))
+    if cached is None:
+        return False, None
+    return True, None if cached == NO_WORK else cached
+
+
+def get_active_work(user_id):
+    """Открытая работа пользователя вместе с объектом или None"""
+    cache = get_cache()
+    cached = cache.get(cache_key(user_id))
+    if cached is not None:
+        count(HITS_KEY)
+        return None if cached == NO_WORK else cached
+
+    count(MISSES_KEY)
+    Work = apps.get_model("main_app", "Work")
+    work = (
+        Work.objects.select_related("object")
+        .filter(user_id=user_id, end_time__isnull=True)
+        .first()
+    )
+    cache.set(
+        cache_key(user_id),
+        NO_WORK if work is None else work,
+        timeout=settings.ACTIVE_WORK_CACHE_TIMEOUT,
+    )
+    return work
+
+
+def invalidate(user_id):
+    key = cache_key(user_id)
+    get_cache().delete(key)
+    # Повторный сброс после коммита, чтобы не закэшировать состояние
+    # из еще не закоммиченной транзакции
+    transaction.on_commit(lambda: get_cache().delete(key))
+
+
+def stats():
+    cache = get_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else None,
+    }
@@ -1,6 +1,12 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.http import HttpResponse
+from django.urls import reverse
 from django.utils.html import format_html
-from .models import Object, Work, Review, WorkImage
+from .models import Object, Work, Review, WorkImage, WorkAlreadyEnded
+from . import qr
+from .qr_sheets import render_pages, to_pdf
+from .renditions import rendition_urls
 from auth_app.models import CustomUser
 
 class WorkInline(admin.TabularInline):
@@ -20,16 +26,53 @@ class WorkImageInline(admin.TabularInline):
     readonly_fields = ('image_preview', 'uploaded_at')
 
     def image_preview(self, obj):
-        return format_html('<img src="{}" style="max-height: 100px;"/>', obj.image.url) if obj.image else ""
+        return format_html('<img src="{}" style="max-height: 100px;"/>', rendition_urls(obj)["thumb"]) if obj.image else ""
     image_preview.short_description = "Превью"
 
 @admin.register(Object)
 class ObjectAdmin(admin.ModelAdmin):
-    list_display = ('name', 'address', 'deadline', 'status', 'supervisor', 'start_time', 'end_time')
+    list_display = ('name', 'address', 'deadline', 'status', 'supervisor', 'start_time', 'end_time', 'completed_works_count')
     list_filter = ('status', 'supervisor')
     search_fields = ('name', 'address')
     filter_horizontal = ('worker',)
     inlines = [WorkInline]
+    actions = ['render_qr_codes', 'print_qr_sheets']
+
+    def too_many_for_admin(self, request, queryset, command):
+        """
+        Действия с QR-кодами выполняются в запросе админки, поэтому число
+        объектов ограничено, большие тиражи - командой command
+        """
+        limit = settings.QR_SHEET_COLUMNS * settings.QR_SHEET_ROWS * settings.QR_SHEET_ADMIN_MAX_PAGES
+        if queryset.count() <= limit:
+            return False
+        self.message_user(
+            request,
+            f"Не больше {limit} объектов за раз, для большего числа - python manage.py {command}",
+            level=messages.ERROR,
+        )
+        return True
+
+    def render_qr_codes(self, request, queryset):
+        if self.too_many_for_admin(request, queryset, "rerender_qr_codes"):
+            return
+        objects = list(queryset.only('id'))
+        for obj in objects:
+            for image_format in qr.FORMATS:
+                qr.render(obj.id, image_format)
+            obj.qr_code = request.build_absolute_uri(reverse('object_qr', args=[obj.id])) + '?type=png'
+        Object.objects.bulk_update(objects, ['qr_code'])
+        self.message_user(request, f"QR-коды готовы: {len(objects)}")
+    render_qr_codes.short_description = "Сгенерировать QR-коды"
+
+    def print_qr_sheets(self, request, queryset):
+        # Без пула процессов: в процессе запроса админки
+        if self.too_many_for_admin(request, queryset, "render_qr_sheets"):
+            return None
+        response = HttpResponse(to_pdf(render_pages(queryset, workers=1)), content_type='application/pdf')
+        response['Content-Disposition'] = 'attachment; filename="qr-labels.pdf"'
+        return response
+    print_qr_sheets.short_description = "Листы QR-наклеек для печати (PDF)"
 
     def formfield_for_manytomany(self, db_field, request, **kwargs):
         if db_field.name == "worker":
@@ -66,7 +109,11 @@ class WorkAdmin(admin.ModelAdmin):
     def end_work(self, request, queryset):
         for work in queryset:
             if work.end_time is None:
-                work.end_work()
+                try:
+                    work.end_work()
+                except WorkAlreadyEnded:
+                    # Работу успели завершить, пока шло действие
+                    pass
     end_work.short_description = "Завершить выбранные работы"
 
 @admin.register(Review)
@@ -86,13 +133,17 @@ class ReviewAdmin(admin.ModelAdmin):
 
 @admin.register(WorkImage)
 class WorkImageAdmin(admin.ModelAdmin):
-    list_display = ('work', 'uploaded_at', 'image_preview')
-    list_filter = ('work__user', 'work__object')
+    list_display = ('work', 'uploaded_at', 'image_preview', 'qr_check', 'original_size', 'stored_size', 'bytes_saved')
+    list_filter = ('qr_check', 'work__user', 'work__object')
     search_fields = ('work__id',)
-    readonly_fields = ('uploaded_at', 'image_preview')
+    readonly_fields = ('uploaded_at', 'image_preview', 'qr_check', 'qr_checked_at', 'original_size', 'stored_size')
+
+    def bytes_saved(self, obj):
+        return obj.bytes_saved
+    bytes_saved.short_description = "Сэкономлено байт"
 
     def image_preview(self, obj):
-        return format_html('<img src="{}" style="max-height: 200px;"/>', obj.image.url) if obj.image else ""
+        return format_html('<img src="{}" style="max-height: 200px;"/>', rendition_urls(obj)["thumb"]) if obj.image else ""
     image_preview.short_description = "Превью"
 
     def has_add_permission(self, request):
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class MainAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "main_app"
+
+    def ready(self):
+        # Подключение обработчиков сброса кэша доступа и кэша QR-кодов,
+        # системных проверок настроек
+        from . import access, checks, qr  # noqa: F401
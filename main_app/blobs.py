@@ -0,0 +1,136 @@
+"""
+Хранение фото по содержимому (content-addressed).
+
+Имя файла - SHA-256 содержимого, каталог задает стратегия
+MEDIA_PATH_STRATEGY:
+    hash - images/ab/abcdef....jpg (по первым символам хеша)
+    date - images/2025/01/31/abcdef....jpg (по дате загрузки)
+В одном каталоге не скапливаются сотни тысяч файлов, а имена не
+пересекаются, так что хранилищу не нужно подбирать свободное имя. Файл по
+такому имени никогда не меняется и отдается с Cache-Control: immutable.
+
+Одинаковые фото (повтор загрузки, одно фото к нескольким работам) лежат на
+диске один раз, строки WorkImage ссылаются на общий файл (для date - в
+пределах дня). Общий файл не удаляется вместе со строкой, файлы без ссылок
+удаляет purge_orphaned_media: так удаление не гонится с параллельной
+загрузкой того же фото.
+
+Строки, загруженные до появления хеша (content_hash пустой), ссылаются на
+свои собственные файлы, перенести их можно командой relocate_media.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+BLOB_DIR = "images"
+HASH_READ_BLOCK = 64 * 1024
+
+
+def content_hash(file):
+    # Хеш мог быть посчитан при приеме файла (upload_handlers.py)
+    if getattr(file, "sha256", None):
+        return file.sha256
+    file.seek(0)
+    digest = hashlib.sha256()
+    for chunk in file.chunks(HASH_READ_BLOCK):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def extension(filename):
+    return os.path.splitext(filename)[1].lower() or ".jpg"
+
+
+def hash_dir(digest, date):
+    return digest[:2]
+
+
+def date_dir(digest, date):
+    return date.strftime("%Y/%m/%d")
+
+
+PATH_STRATEGIES = {
+    "hash": (hash_dir, r"[0-9a-f]{2}"),
+    "date": (date_dir, r"\d{4}/\d{2}/\d{2}"),
+}
+
+
+def blob_name(digest, filename, date=None):
+    shard, _ = PATH_STRATEGIES[settings.MEDIA_PATH_STRATEGY]
+    date = timezone.localtime(date or timezone.now())
+    return f"{BLOB_DIR}/{shard(digest, date)}/{digest}{extension(filename)}"
+
+
+def is_placed(name, digest):
+    """Лежит ли файл по схеме текущей стратегии (дата у date может быть любой)"""
+    if not digest:
+        return False
+    _, pattern = PATH_STRATEGIES[settings.MEDIA_PATH_STRATEGY]
+    return re.fullmatch(rf"{BLOB_DIR}/{pattern}/{digest}\.\w+", name) is not None
+
+
+def upload_to(instance, filename):
+    """
+    Для файлов, сохраненных в обход store(): каталог по дате, уникальное имя
+    """
+    return f"{BLOB_DIR}/{timezone.localdate():%Y/%m/%d}/{uuid.uuid4().hex}{extension(filename)}"
+
+
+def store(instance):
+    """
+    Кладет новый файл instance.image в хранилище по хешу. Если такой файл
+    уже есть, строка просто ссылается на него, повторной записи нет
+    """
+    file = instance.image.file
+    instance.content_hash = content_hash(file)
+    storage = instance.image.storage
+    name = blob_name(instance.content_hash, instance.image.name)
+    try:
+        # Свежее время изменения не дает purge_orphaned_media удалить файл,
+        # пока транзакция новой строки не закоммичена
+        os.utime(storage.path(name))
+    except FileNotFoundError:
+        saved = storage.save(name, file)
+        if saved != name:
+            # Параллельная загрузка того же содержимого успела первой,
+            # вторая копия под другим именем не нужна
+            storage.delete(saved)
+    instance.image = name
+
+
+def copy(storage, source, target):
+    """Копирует файл под новое имя, если его там еще нет"""
+    if storage.exists(target):
+        return target
+    with storage.open(source, "rb") as f:
+        return storage.save(target, f)
+
+
+def release(instance):
+    """
+    Вызывается после удаления строки. Общий файл (есть content_hash) сразу
+    не удаляется: параллельная загрузка того же содержимого могла сослаться
+    на него в еще не закоммиченной транзакции. Такие файлы без ссылок
+    собирает purge_orphaned_media по истечении --min-age. Собственный файл
+    старой строки (без хеша) удаляется после коммита
+    """
+    if not instance.image or instance.content_hash:
+        return
+    model = type(instance)
+    storage = instance.image.storage
+    name = instance.image.name
+    paths = [name, *(instance.renditions or {}).values()]
+
+    def remove():
+        if model.objects.filter(image=name).exists():
+            return
+        for path in paths:
+            storage.delete(path)
+
+    transaction.on_commit(remove)
@@ -0,0 +1,43 @@
+"""
+Системные проверки настроек приложения (manage.py check --deploy).
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+INSECURE_PREFIX = "django-insecure"
+
+
+@register(Tags.security, deploy=True)
+def check_qr_signing_keys(app_configs, **kwargs):
+    """Ключи подписи QR-кодов не должны быть ключами из репозитория"""
+    insecure = [
+        version for version, key in settings.QR_SIGNING_KEYS.items()
+        if not key or key.startswith(INSECURE_PREFIX)
+    ]
+    if not insecure:
+        return []
+    return [
+        Error(
+            f"Ключ подписи QR-кодов версий {insecure} не задан или взят из репозитория",
+            hint="Задайте переменную окружения QR_SIGNING_KEY",
+            id="main_app.E001",
+        )
+    ]
+
+
+@register(Tags.caches, deploy=True)
+def check_active_work_cache(app_configs, **kwargs):
+    """Кэш открытых работ должен быть общим для процессов сервера"""
+    backend = settings.CACHES[settings.ACTIVE_WORK_CACHE]["BACKEND"]
+    if not backend.endswith("LocMemCache"):
+        return []
+    return [
+        Warning(
+            "Кэш открытых работ (ACTIVE_WORK_CACHE) хранится в памяти процесса",
+            hint=(
+                "При нескольких процессах сервера сброс кэша в одном не виден другим, "
+                "используйте FileBasedCache, Redis или DatabaseCache"
+            ),
+            id="main_app.W001",
+        )
+    ]
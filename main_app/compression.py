@@ -0,0 +1,92 @@
+"""
+Пережатие загружаемых фото (включается IMAGE_COMPRESSION_ENABLED).
+
+Фото поворачивается по EXIF-ориентации, уменьшается до
+IMAGE_COMPRESSION_MAX_DIMENSION по большей стороне и пережимается в JPEG
+или WebP. Из EXIF остается только время съемки, прозрачные области в JPEG
+заливаются белым (WebP сохраняет прозрачность). Исходный файл сохраняется
+вместо результата, только если тот не меньше и в исходном нечего убирать:
+нет других тегов EXIF, XMP и поворота.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+EXIF_IFD = 0x8769
+DATETIME = 306
+# DateTimeOriginal, DateTimeDigitized, OffsetTimeOriginal
+CAPTURE_TIME_TAGS = (36867, 36868, 36881)
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+
+
+def capture_time_exif(image):
+    """Новый EXIF только с временем съемки из исходного"""
+    source = image.getexif()
+    exif = Image.Exif()
+    if DATETIME in source:
+        exif[DATETIME] = source[DATETIME]
+    source_ifd = source.get_ifd(EXIF_IFD)
+    ifd = exif.get_ifd(EXIF_IFD)
+    for tag in CAPTURE_TIME_TAGS:
+        if tag in source_ifd:
+            ifd[tag] = source_ifd[tag]
+    return exif
+
+
+def has_metadata(image):
+    """Есть ли в исходном EXIF, XMP или поворот, которые пережатие убирает"""
+    source = image.getexif()
+    if set(source) - {DATETIME, EXIF_IFD} or set(source.get_ifd(EXIF_IFD)) - set(CAPTURE_TIME_TAGS):
+        return True
+    return any(key in image.info for key in ("xmp", "XML:com.adobe.xmp", "comment"))
+
+
+def flatten(image, image_format):
+    """RGB, прозрачность - на белом фоне; WebP оставляет альфа-канал"""
+    if image.mode not in ("RGBA", "LA", "PA") and "transparency" not in image.info:
+        return image.convert("RGB")
+    image = image.convert("RGBA")
+    if image_format == "WEBP":
+        return image
+    background = Image.new("RGB", image.size, "white")
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+
+def compress(uploaded):
+    """
+    Пережимает загруженный файл. Возвращает (файл для сохранения,
+    исходный размер, итоговый размер)
+    """
+    original_size = uploaded.size
+    max_dimension = settings.IMAGE_COMPRESSION_MAX_DIMENSION
+    image_format = settings.IMAGE_COMPRESSION_FORMAT.upper()
+
+    uploaded.seek(0)
+    image = Image.open(uploaded)
+    exif = capture_time_exif(image)
+    keep_original = not has_metadata(image)
+    # JPEG декодируется сразу в уменьшенном масштабе
+    image.draft("RGB", (max_dimension, max_dimension))
+    image = flatten(ImageOps.exif_transpose(image), image_format)
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    buffer = BytesIO()
+    image.save(
+        buffer,
+        image_format,
+        quality=settings.IMAGE_COMPRESSION_QUALITY,
+        exif=exif,
+        **({"optimize": True} if image_format == "JPEG" else {"method": 4}),
+    )
+    uploaded.seek(0)
+    # Файл с GPS, моделью устройства или поворотом не сохраняется как есть, даже если он меньше
+    if keep_original and buffer.tell() >= original_size:
+        return uploaded, original_size, original_size
+
+    root, _ = os.path.splitext(os.path.basename(uploaded.name))
+    compressed = ContentFile(buffer.getvalue(), name=f"{root}.{EXTENSIONS[image_format]}")
+    return compressed, original_size, compressed.size
@@ -0,0 +1,71 @@
+"""
+Пересчет и проверка денормализованных счетчиков завершенных работ
+(Object.completed_works_count и ObjectUserStats).
+"""
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Object, ObjectUserStats, Work
+
+
+def completed_counts():
+    """Фактические числа завершенных работ по (объект, пользователь)"""
+    rows = (
+        Work.objects.filter(start_time__isnull=False, end_time__isnull=False)
+        .values("object_id", "user_id")
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+    return {(row["object_id"], row["user_id"]): row["total"] for row in rows}
+
+
+def rebuild():
+    """Пересчитывает все счетчики с нуля, возвращает число строк статистики"""
+    counts = completed_counts()
+    per_object = {}
+    for (object_id, _), total in counts.items():
+        per_object[object_id] = per_object.get(object_id, 0) + total
+
+    # Завершения работ во время пересчета могут потеряться, запускать
+    # в спокойное время и проверять результат через --check
+    with transaction.atomic():
+        ObjectUserStats.objects.all().delete()
+        ObjectUserStats.objects.bulk_create(
+            [
+                ObjectUserStats(object_id=object_id, user_id=user_id, completed_works=total)
+                for (object_id, user_id), total in counts.items()
+            ],
+            batch_size=1000,
+        )
+        Object.objects.update(completed_works_count=0)
+        for object_id, total in per_object.items():
+            Object.objects.filter(pk=object_id).update(completed_works_count=total)
+    return len(counts)
+
+
+def find_mismatches():
+    """Список расхождений счетчиков с фактическими данными"""
+    counts = completed_counts()
+    mismatches = []
+
+    stored = {
+        (row.object_id, row.user_id): row.completed_works
+        for row in ObjectUserStats.objects.all()
+    }
+    for key in counts.keys() | stored.keys():
+        expected, actual = counts.get(key, 0), stored.get(key, 0)
+        if expected != actual:
+            mismatches.append(
+                {"object": key[0], "user": key[1], "expected": expected, "actual": actual}
+            )
+
+    per_object = {}
+    for (object_id, _), total in counts.items():
+        per_object[object_id] = per_object.get(object_id, 0) + total
+    for object_id, actual in Object.objects.values_list("id", "completed_works_count"):
+        expected = per_object.get(object_id, 0)
+        if expected != actual:
+            mismatches.append(
+                {"object": object_id, "user": None, "expected": expected, "actual": actual}
+            )
+    return mismatches
@@ -0,0 +1,94 @@
+"""
+Потоковая выгрузка истории работ объекта в NDJSON или CSV.
+
+Работы читаются курсором на стороне сервера (QuerySet.iterator), оценки
+подтягиваются JOIN, изображения - одним запросом на каждую пачку
+EXPORT_CHUNK_SIZE работ. В памяти одновременно только одна пачка.
+"""
+import csv
+
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Work
+from .renditions import media_url
+
+CSV_COLUMNS = [
+    "id", "name", "description", "user", "start_time", "end_time",
+    "rating", "comment", "review_date", "review_supervisor", "images",
+]
+
+
+def image_url(image):
+    return media_url(image.image.name)
+
+
+def iter_works(object_id):
+    works = (
+        Work.objects.filter(object_id=object_id)
+        .with_review_and_images()
+        .order_by("id")
+    )
+    return works.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def work_row(work):
+    try:
+        review = work.review
+    except Work.review.RelatedObjectDoesNotExist:
+        review = None
+    return {
+        "id": work.id,
+        "name": work.name,
+        "description": work.description,
+        "user": work.user_id,
+        "start_time": work.start_time,
+        "end_time": work.end_time,
+        "review": review and {
+            "rating": review.rating,
+            "comment": review.comment,
+            "review_date": review.review_date,
+            "supervisor": review.supervisor_id,
+        },
+        "images": [image_url(image) for image in work.images if image.image],
+    }
+
+
+def ndjson_lines(object_id):
+    encoder = JSONEncoder(ensure_ascii=False)
+    for work in iter_works(object_id):
+        yield encoder.encode(work_row(work)) + "\n"
+
+
+class Echo:
+    """Файлоподобный объект для csv.writer, который просто отдает строку"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(object_id):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for work in iter_works(object_id):
+        row = work_row(work)
+        review = row["review"] or {}
+        yield writer.writerow([
+            row["id"],
+            row["name"],
+            row["description"],
+            row["user"],
+            row["start_time"].isoformat() if row["start_time"] else "",
+            row["end_time"].isoformat() if row["end_time"] else "",
+            review.get("rating", ""),
+            review.get("comment", ""),
+            review["review_date"].isoformat() if review.get("review_date") else "",
+            review.get("supervisor", ""),
+            " ".join(row["images"]),
+        ])
+
+
+FORMATS = {
+    "ndjson": (ndjson_lines, "application/x-ndjson; charset=utf-8"),
+    "csv": (csv_lines, "text/csv; charset=utf-8"),
+}
@@ -0,0 +1,96 @@
+import functools
+import json
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+
+
+def purge_expired():
+    """Удаляет ключи старше IDEMPOTENCY_KEY_TTL, возвращает число удаленных"""
+    expired_before = timezone.now() - settings.IDEMPOTENCY_KEY_TTL
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=expired_before).delete()
+    return deleted
+
+
+def replay(record):
+    response = Response(record.response_body, status=record.status_code)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def reserve(user, key, path):
+    """
+    Занимает ключ за текущим запросом. Если ключ уже занят, возвращает
+    сохраненную запись - повтор обходится одним SELECT
+    """
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is not None:
+        if record.created_at >= timezone.now() - settings.IDEMPOTENCY_KEY_TTL:
+            return record
+        # Просроченный ключ можно использовать заново
+        record.delete()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(user=user, key=key, request_path=path)
+    except IntegrityError:
+        # Параллельный запрос с тем же ключом успел занять его раньше
+        return IdempotencyKey.objects.filter(user=user, key=key).first()
+    return None
+
+
+def idempotent(view_method):
+    """
+    Повтор запроса с тем же заголовком Idempotency-Key возвращает сохраненный
+    ответ, не выполняя запись повторно
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response(
+                {"error": "Слишком длинный Idempotency-Key"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        record = reserve(request.user, key, request.path)
+        if record is not None:
+            if record.request_path != request.path:
+                return Response(
+                    {"error": "Idempotency-Key уже использован для другого запроса"},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if record.status_code is None:
+                return Response(
+                    {"error": "Запрос с этим Idempotency-Key еще выполняется"},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            return replay(record)
+
+        stored = IdempotencyKey.objects.filter(user=request.user, key=key)
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            stored.delete()
+            raise
+
+        if response.status_code >= 500:
+            stored.delete()
+        else:
+            stored.update(
+                status_code=response.status_code,
+                response_body=json.loads(json.dumps(response.data, cls=JSONEncoder)),
+            )
+        return response
+
+    return wrapper
@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from main_app.models import WorkImage
+from main_app.renditions import generate
+
+
+class Command(BaseCommand):
+    help = "Делает уменьшенные копии для изображений, у которых их еще нет"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument(
+            "--workers", type=int, default=settings.IMAGE_RENDITIONS_WORKERS,
+            help="Число потоков обработки",
+        )
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Пересоздать копии и для изображений, у которых они уже есть",
+        )
+
+    def handle(self, *args, **options):
+        images = WorkImage.objects.exclude(image="")
+        if not options["all"]:
+            images = images.filter(renditions={})
+        pending = images.order_by("id").values_list("id", flat=True)
+
+        done = failed = 0
+        last_id = 0
+        executor = None
+        if options["workers"] > 1:
+            executor = ThreadPoolExecutor(max_workers=options["workers"])
+        try:
+            while True:
+                batch = list(pending.filter(id__gt=last_id)[: options["batch_size"]])
+                if not batch:
+                    break
+                last_id = batch[-1]
+                if executor is None:
+                    results = map(self.safe_generate, batch)
+                else:
+                    results = executor.map(self.generate_in_thread, batch)
+                for result in results:
+                    if result is None:
+                        failed += 1
+                    else:
+                        done += 1
+                self.stdout.write(f"Обработано до id {last_id}: готово {done}, ошибок {failed}")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f"Готово: {done}, ошибок: {failed}"))
+
+    def safe_generate(self, image_id):
+        try:
+            return generate(image_id)
+        except Exception as e:
+            self.stderr.write(f"Изображение {image_id}: {e}")
+            return None
+
+    def generate_in_thread(self, image_id):
+        try:
+            return self.safe_generate(image_id)
+        finally:
+            # У потока свое соединение с базой
+            connection.close()
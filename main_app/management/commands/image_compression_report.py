@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Q, Sum
+
+from main_app.models import WorkImage
+
+
+class Command(BaseCommand):
+    help = "Сколько места сэкономило пережатие загруженных фото"
+
+    def handle(self, *args, **options):
+        totals = WorkImage.objects.filter(
+            original_size__isnull=False, stored_size__isnull=False
+        ).aggregate(
+            images=Count("id"),
+            original=Sum("original_size"),
+            stored=Sum("stored_size"),
+            recompressed=Count("id", filter=~Q(stored_size=F("original_size"))),
+        )
+        original = totals["original"] or 0
+        stored = totals["stored"] or 0
+        self.stdout.write(f"Изображений с известным размером: {totals['images']}")
+        self.stdout.write(f"Из них пережато: {totals['recompressed']}")
+        self.stdout.write(f"Исходный объем: {original} байт")
+        self.stdout.write(f"Сохранено: {stored} байт")
+        ratio = f" (в {original / stored:.1f} раза меньше)" if stored else ""
+        self.stdout.write(self.style.SUCCESS(f"Сэкономлено: {original - stored} байт{ratio}"))
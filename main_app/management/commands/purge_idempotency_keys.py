@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from main_app.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Удаляет сохраненные ответы Idempotency-Key старше IDEMPOTENCY_KEY_TTL"
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Удалено ключей: {deleted}"))
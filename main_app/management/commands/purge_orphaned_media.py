@@ -0,0 +1,52 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.blobs import BLOB_DIR
+from main_app.orphans import find_orphans
+
+
+class Command(BaseCommand):
+    help = "Удаляет файлы фото в MEDIA_ROOT, на которые не ссылается ни одна запись"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Только вывести найденные файлы, ничего не удаляя",
+        )
+        parser.add_argument(
+            "--min-age", type=int, default=24,
+            help="Не трогать файлы моложе стольких часов (загрузки, которые еще не сохранились)",
+        )
+        parser.add_argument(
+            "--dir", default=BLOB_DIR,
+            help="Каталог внутри MEDIA_ROOT, который нужно проверить",
+        )
+
+    def handle(self, *args, **options):
+        root = self.media_dir(options["dir"])
+        count = size = 0
+        for name, file_size in find_orphans(root, timedelta(hours=options["min_age"])):
+            count += 1
+            size += file_size
+            if options["dry_run"]:
+                self.stdout.write(name)
+            else:
+                default_storage.delete(name)
+
+        action = "Найдено" if options["dry_run"] else "Удалено"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} файлов без ссылок: {count}, {size / 1024 / 1024:.1f} МБ"
+        ))
+
+    def media_dir(self, directory):
+        """Путь к каталогу для обхода, только внутри MEDIA_ROOT (с учетом ../ и ссылок)"""
+        media_root = os.path.realpath(settings.MEDIA_ROOT)
+        real_dir = os.path.realpath(os.path.join(media_root, directory))
+        if os.path.commonpath([media_root, real_dir]) != media_root:
+            raise CommandError(f"Каталог {directory} вне MEDIA_ROOT")
+        # Пути файлов считаются от MEDIA_ROOT как есть, поэтому от него и строится каталог
+        return os.path.normpath(os.path.join(settings.MEDIA_ROOT, os.path.relpath(real_dir, media_root)))
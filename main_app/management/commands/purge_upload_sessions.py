@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from main_app.uploads import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Удаляет брошенные докачиваемые загрузки старше UPLOAD_SESSION_TTL"
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Удалено сессий: {deleted}"))
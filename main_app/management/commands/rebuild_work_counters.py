@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.counters import find_mismatches, rebuild
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счетчики завершенных работ объектов и пользователей"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только проверить счетчики и вывести расхождения, ничего не меняя",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            mismatches = find_mismatches()
+            for row in mismatches:
+                target = f"объект {row['object']}"
+                if row["user"] is not None:
+                    target += f", пользователь {row['user']}"
+                self.stdout.write(
+                    f"{target}: ожидается {row['expected']}, сохранено {row['actual']}"
+                )
+            if mismatches:
+                raise CommandError(f"Найдено расхождений: {len(mismatches)}")
+            self.stdout.write(self.style.SUCCESS("Счетчики совпадают с данными"))
+            return
+
+        rows = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Счетчики пересчитаны, строк статистики: {rows}"))
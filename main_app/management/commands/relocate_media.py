@@ -0,0 +1,96 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main_app import blobs
+from main_app.models import WorkImage
+from main_app.renditions import rendition_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит файлы фото в раскладку MEDIA_PATH_STRATEGY. Можно прервать и "
+        "запустить снова: уже перенесенные файлы пропускаются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        images = (
+            WorkImage.objects.exclude(image="")
+            .order_by("id")
+            .only("id", "image", "content_hash", "renditions", "uploaded_at")
+        )
+        moved = skipped = missing = 0
+        last_id = 0
+        while True:
+            batch = list(images.filter(id__gt=last_id)[: options["batch_size"]])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            # Строки пачки с общим файлом переносятся вместе с первой из них,
+            # в памяти у остальных старое имя
+            done = {}
+            for image in batch:
+                name = image.image.name
+                if name in done:
+                    result = done[name]
+                elif blobs.is_placed(name, image.content_hash):
+                    result = "placed"
+                elif not default_storage.exists(name):
+                    self.stderr.write(f"Изображение {image.id}: нет файла {name}")
+                    result = "missing"
+                else:
+                    result = "moved" if self.relocate(image) else "placed"
+                done[name] = result
+                if result == "moved":
+                    moved += 1
+                elif result == "placed":
+                    skipped += 1
+                else:
+                    missing += 1
+            self.stdout.write(
+                f"Обработано до id {last_id}: перенесено {moved}, на месте {skipped}, без файла {missing}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: перенесено {moved}, на месте {skipped}, без файла {missing}"
+        ))
+
+    def relocate(self, image):
+        """
+        Копия под новым именем -> обновление всех строк со старым именем ->
+        удаление старых файлов после коммита. Если команда оборвется между
+        шагами, повторный запуск продолжит с того же места, а брошенные
+        старые файлы уберет сборка мусора. Возвращает False, если файл уже
+        лежит на месте (у строки не было хеша)
+        """
+        source = image.image.name
+        if not image.content_hash:
+            with default_storage.open(source, "rb") as f:
+                image.content_hash = blobs.content_hash(f)
+        target = blobs.blob_name(image.content_hash, source, image.uploaded_at)
+        if target == source:
+            WorkImage.objects.filter(image=source).update(content_hash=image.content_hash)
+            return False
+        target = blobs.copy(default_storage, source, target)
+        renditions = {
+            name: blobs.copy(default_storage, path, rendition_name(target, name))
+            for name, path in (image.renditions or {}).items()
+            if default_storage.exists(path)
+        }
+        # Живые файлы (новое место и копии) не удаляются, даже если имя совпало со старым
+        keep = {target, *renditions.values()}
+        old_paths = [path for path in (source, *(image.renditions or {}).values()) if path not in keep]
+
+        with transaction.atomic():
+            WorkImage.objects.filter(image=source).update(
+                image=target, content_hash=image.content_hash, renditions=renditions
+            )
+            transaction.on_commit(lambda: self.delete_files(old_paths))
+        return True
+
+    def delete_files(self, paths):
+        for path in paths:
+            default_storage.delete(path)
@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.models import Object
+from main_app.qr_sheets import render_pages, to_pdf
+
+
+class Command(BaseCommand):
+    help = "Рисует листы QR-наклеек объектов для печати (PDF или PNG-страницы)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Файл PDF или каталог для PNG-страниц")
+        parser.add_argument("--ids", help="ID объектов через запятую (по умолчанию все)")
+        parser.add_argument("--supervisor", type=int, help="Только объекты этого прораба")
+        parser.add_argument("--type", choices=["pdf", "png"], default="pdf")
+        parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию по числу ядер)")
+
+    def handle(self, *args, **options):
+        objects = Object.objects.all()
+        if options["ids"]:
+            try:
+                ids = [int(value) for value in options["ids"].split(",") if value.strip()]
+            except ValueError:
+                raise CommandError("--ids: ожидаются числа через запятую")
+            objects = objects.filter(id__in=ids)
+        if options["supervisor"]:
+            objects = objects.filter(supervisor_id=options["supervisor"])
+
+        pages = render_pages(objects, options["workers"])
+        if not pages:
+            raise CommandError("Нет объектов для печати")
+
+        output = options["output"]
+        if options["type"] == "pdf":
+            with open(output, "wb") as f:
+                f.write(to_pdf(pages))
+        else:
+            os.makedirs(output, exist_ok=True)
+            for number, page in enumerate(pages, start=1):
+                with open(os.path.join(output, f"qr-{number:03d}.png"), "wb") as f:
+                    f.write(page)
+        self.stdout.write(self.style.SUCCESS(f"Страниц: {len(pages)}, сохранено в {output}"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from main_app.models import Object
+from main_app.qr_sheets import rerender
+
+
+class Command(BaseCommand):
+    help = (
+        "Перерисовывает QR-коды всех объектов с текущим ключом подписи "
+        "(после смены QR_SIGNING_KEY_VERSION), старые картинки удаляются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию по числу ядер)")
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        count = rerender(Object.objects.all(), options["workers"], options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Перерисовано QR-кодов: {count}"))
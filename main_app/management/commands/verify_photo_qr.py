@@ -0,0 +1,47 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main_app import photo_qr
+from main_app.models import WorkImage
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверяет QR-код объекта на уже загруженных фото. По умолчанию - только "
+        "непроверенные и с ошибкой проверки, --all - все фото"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Проверить заново все фото")
+        parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию QR_PHOTO_VERIFICATION_WORKERS)")
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        images = WorkImage.objects.exclude(image="").order_by("id")
+        if not options["all"]:
+            images = images.filter(qr_check__in=["", photo_qr.FAILED])
+        images = images.values_list("id", "image", "work__object_id")
+
+        counts = {}
+        last_id = 0
+        while True:
+            batch = list(images.filter(id__gt=last_id)[: options["batch_size"]])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            results = photo_qr.verify_many(
+                [(image_id, default_storage.path(name), object_id) for image_id, name, object_id in batch],
+                options["workers"],
+            )
+            checked_at = timezone.now()
+            for qr_check in set(results.values()):
+                ids = [image_id for image_id, value in results.items() if value == qr_check]
+                WorkImage.objects.filter(id__in=ids).update(qr_check=qr_check, qr_checked_at=checked_at)
+                counts[qr_check] = counts.get(qr_check, 0) + len(ids)
+            self.stdout.write(f"Проверено до id {last_id}: {self.format_counts(counts)}")
+
+        self.stdout.write(self.style.SUCCESS(f"Готово: {self.format_counts(counts)}"))
+
+    def format_counts(self, counts):
+        return ", ".join(f"{qr_check} {count}" for qr_check, count in sorted(counts.items())) or "нет фото"
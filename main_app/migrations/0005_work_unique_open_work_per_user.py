@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0004_work_description_work_name"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="work",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("end_time__isnull", True)),
+                fields=("user",),
+                name="unique_open_work_per_user",
+            ),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_counters(apps, schema_editor):
+    Object = apps.get_model("main_app", "Object")
+    Work = apps.get_model("main_app", "Work")
+    ObjectUserStats = apps.get_model("main_app", "ObjectUserStats")
+
+    rows = (
+        Work.objects.filter(start_time__isnull=False, end_time__isnull=False)
+        .values("object_id", "user_id")
+        .annotate(total=models.Count("id"))
+        .order_by()
+    )
+    per_object = {}
+    stats = []
+    for row in rows:
+        stats.append(
+            ObjectUserStats(
+                object_id=row["object_id"],
+                user_id=row["user_id"],
+                completed_works=row["total"],
+            )
+        )
+        per_object[row["object_id"]] = (
+            per_object.get(row["object_id"], 0) + row["total"]
+        )
+    ObjectUserStats.objects.bulk_create(stats, batch_size=1000)
+    for object_id, total in per_object.items():
+        Object.objects.filter(pk=object_id).update(completed_works_count=total)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0006_idempotencykey"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="object",
+            name="completed_works_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name="ObjectUserStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("completed_works", models.PositiveIntegerField(default=0)),
+                (
+                    "object",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="user_stats",
+                        to="main_app.object",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="object_stats",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("object", "user"), name="unique_object_user_stats"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0007_work_counters"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="work",
+            index=models.Index(
+                fields=["object", "-start_time", "-id"], name="work_object_start_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="work",
+            index=models.Index(
+                fields=["user", "-start_time", "-id"], name="work_user_start_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="work",
+            index=models.Index(fields=["-start_time", "-id"], name="work_start_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="workimage",
+            index=models.Index(
+                fields=["work", "uploaded_at", "id"], name="workimage_work_uploaded_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0009_workimage_renditions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="workimage",
+            name="original_size",
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="workimage",
+            name="stored_size",
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0011_uploadsession"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="workimage",
+            name="content_hash",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=64, null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:42
+
+import main_app.blobs
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0012_workimage_content_hash"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="workimage",
+            name="image",
+            field=models.ImageField(upload_to=main_app.blobs.upload_to),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:44
+
+import main_app.blobs
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0013_workimage_upload_to"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="workimage",
+            name="image",
+            field=models.ImageField(db_index=True, upload_to=main_app.blobs.upload_to),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0014_workimage_image_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="workimage",
+            name="qr_check",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("", "Не проверено"),
+                    ("verified", "QR-код объекта найден"),
+                    ("mismatch", "QR-код другого объекта"),
+                    ("missing", "QR-код не найден"),
+                    ("failed", "Ошибка проверки"),
+                ],
+                default="",
+                editable=False,
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="workimage",
+            name="qr_checked_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="workimage",
+            index=models.Index(
+                condition=models.Q(("qr_check", "verified"), _negated=True),
+                fields=["uploaded_at", "id"],
+                name="workimage_qr_unverified_idx",
+            ),
+        ),
+    ]
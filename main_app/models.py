@@ -1,7 +1,21 @@
 from ast import mod
-import datetime
-from django.db import models
+import uuid
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
 from auth_app.models import CustomUser
+from . import active_work, blobs
+
+
+class ActiveWorkExists(Exception):
+    """У пользователя уже есть незавершенная работа"""
+
+
+class WorkAlreadyEnded(Exception):
+    """Работа уже завершена (в том числе параллельным запросом)"""
+
 
 # Create your models here.
 class Object(models.Model):
@@ -21,11 +35,21 @@ class Object(models.Model):
     start_time = models.DateTimeField(null=True, blank=True)
     end_time = models.DateTimeField(null=True, blank=True)
     qr_code = models.URLField(blank=True, null=True)  # Ссылка на QR-код
+    # Число завершенных работ, ведется в Work.end_work и сигналах сохранения Work
+    completed_works_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
 
 
+class WorkQuerySet(models.QuerySet):
+    def with_review_and_images(self):
+        """Оценка одним JOIN и все изображения одним запросом в work.images"""
+        return self.select_related('review').prefetch_related(
+            models.Prefetch('workimage_set', to_attr='images')
+        )
+
+
 class Work(models.Model):
     id = models.BigAutoField(primary_key=True)
     name = models.CharField(max_length=255, null=True, blank=False)
@@ -35,15 +59,142 @@ class Work(models.Model):
     start_time = models.DateTimeField(null=True, blank=True)
     end_time = models.DateTimeField(null=True, blank=True)
 
-    def start_work(self, name: str, description: str = None):
-        self.start_time = datetime.datetime.now()
+    objects = WorkQuerySet.as_manager()
+
+    class Meta:
+        # Под keyset-пагинацию по (start_time, id), новые работы первыми
+        indexes = [
+            models.Index(fields=['object', '-start_time', '-id'], name='work_object_start_id_idx'),
+            models.Index(fields=['user', '-start_time', '-id'], name='work_user_start_id_idx'),
+            models.Index(fields=['-start_time', '-id'], name='work_start_id_idx'),
+        ]
+        constraints = [
+            # Не больше одной незавершенной работы на пользователя
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=Q(end_time__isnull=True),
+                name='unique_open_work_per_user',
+            ),
+        ]
+
+    def start_work(self, name: str, description: str = None, start_time=None):
+        """Начинает работу одним INSERT, гонки разрешает уникальный индекс"""
+        self.start_time = start_time or timezone.now()
         self.name = name
         self.description = description
-        self.save()
+        try:
+            with transaction.atomic():
+                self.save()
+        except IntegrityError:
+            raise ActiveWorkExists()
+        active_work.invalidate(self.user_id)
+
+    def end_work(self, end_time=None):
+        """
+        Завершает работу и в той же транзакции увеличивает счетчики.
+        WorkAlreadyEnded - работу уже завершили, end_time берется из базы
+        """
+        end_time = end_time or timezone.now()
+        with transaction.atomic():
+            # Условный UPDATE: параллельное завершение не посчитается дважды
+            ended = Work.objects.filter(pk=self.pk, end_time__isnull=True).update(
+                end_time=end_time
+            )
+            if ended and self.start_time is not None:
+                ObjectUserStats.add_completed(self.object_id, self.user_id, 1)
+        active_work.invalidate(self.user_id)
+        if not ended:
+            self.refresh_from_db(fields=["end_time"])
+            raise WorkAlreadyEnded()
+        self.end_time = end_time
+
+    @property
+    def is_completed(self):
+        return self.start_time is not None and self.end_time is not None
+
+
+class ObjectUserStats(models.Model):
+    """Число завершенных работ пользователя на объекте"""
+    object = models.ForeignKey(Object, on_delete=models.CASCADE, related_name='user_stats')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='object_stats')
+    completed_works = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['object', 'user'], name='unique_object_user_stats'),
+        ]
+
+    @classmethod
+    def add_completed(cls, object_id, user_id, delta):
+        """Сдвигает счетчики объекта и пользователя на delta, вызывать в транзакции"""
+        # Счетчики не уходят в минус, даже если разошлись с данными
+        Object.objects.filter(pk=object_id, completed_works_count__gte=-delta).update(
+            completed_works_count=F('completed_works_count') + delta
+        )
+        updated = cls.objects.filter(
+            object_id=object_id, user_id=user_id, completed_works__gte=-delta
+        ).update(completed_works=F('completed_works') + delta)
+        if updated or delta < 0:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(object_id=object_id, user_id=user_id, completed_works=delta)
+        except IntegrityError:
+            # Строку успел создать параллельный запрос
+            cls.objects.filter(object_id=object_id, user_id=user_id).update(
+                completed_works=F('completed_works') + delta
+            )
+
+
+def completed_key(object_id, user_id, start_time, end_time):
+    """Ключ счетчиков (объект, пользователь) для завершенной работы, иначе None"""
+    if start_time is None or end_time is None:
+        return None
+    return object_id, user_id
+
+
+@receiver(pre_save, sender=Work)
+def remember_saved_work(sender, instance, raw=False, **kwargs):
+    # Состояние строки до сохранения: правка в админке может сменить
+    # пользователя, объект или время завершения
+    instance._saved_state = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    saved = Work.objects.filter(pk=instance.pk)
+    if transaction.get_connection().in_atomic_block:
+        # Параллельный end_work не проскочит между чтением и сохранением
+        saved = saved.select_for_update()
+    instance._saved_state = saved.values('user_id', 'object_id', 'start_time', 'end_time').first()
 
-    def end_work(self):
-        self.end_time = datetime.datetime.now()
-        self.save()
+
+@receiver(post_save, sender=Work)
+def update_on_work_save(sender, instance, raw=False, **kwargs):
+    # Сохранение в обход start_work/end_work (админка) тоже сбрасывает кэш
+    # открытой работы и сдвигает счетчики завершенных работ
+    if raw:
+        return
+    saved = getattr(instance, '_saved_state', None)
+    if saved and saved['user_id'] != instance.user_id:
+        active_work.invalidate(saved['user_id'])
+    active_work.invalidate(instance.user_id)
+
+    was = completed_key(**saved) if saved else None
+    now = completed_key(instance.object_id, instance.user_id, instance.start_time, instance.end_time)
+    if was != now:
+        with transaction.atomic():
+            if was:
+                ObjectUserStats.add_completed(*was, -1)
+            if now:
+                ObjectUserStats.add_completed(*now, 1)
+
+
+@receiver(post_delete, sender=Work)
+def update_on_work_delete(sender, instance, **kwargs):
+    # Удаление открытой работы (в том числе каскадом) освобождает пользователя
+    if instance.end_time is None:
+        active_work.invalidate(instance.user_id)
+    elif instance.is_completed:
+        ObjectUserStats.add_completed(instance.object_id, instance.user_id, -1)
 
 
 class Review(models.Model):
@@ -57,7 +208,76 @@ class Review(models.Model):
         return f"Review for {self.work.object.name} by {self.supervisor.username}"
 
 class WorkImage(models.Model):
+    QR_CHECK_CHOICES = (
+        ('', 'Не проверено'),
+        ('verified', 'QR-код объекта найден'),
+        ('mismatch', 'QR-код другого объекта'),
+        ('missing', 'QR-код не найден'),
+        ('failed', 'Ошибка проверки'),
+    )
+
     work = models.ForeignKey(Work, on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='images/')
+    # Индекс - для проверки ссылок на файл (blobs.release, purge_orphaned_media)
+    image = models.ImageField(upload_to=blobs.upload_to, db_index=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
-    
+    # Пути уменьшенных копий {имя: путь}, заполняются в фоне (renditions.py)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
+    # Размеры файла до и после пережатия при загрузке (compression.py)
+    original_size = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    stored_size = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    # SHA-256 содержимого, файл общий для строк с одинаковым хешем (blobs.py)
+    content_hash = models.CharField(max_length=64, null=True, blank=True, editable=False, db_index=True)
+    # Проверка QR-кода объекта на фото, заполняется в фоне (photo_qr.py)
+    qr_check = models.CharField(max_length=10, choices=QR_CHECK_CHOICES, default='', blank=True, editable=False)
+    qr_checked_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed:
+            blobs.store(self)
+        super().save(*args, **kwargs)
+
+    @property
+    def bytes_saved(self):
+        if self.original_size is None or self.stored_size is None:
+            return None
+        return self.original_size - self.stored_size
+
+    class Meta:
+        # Под keyset-пагинацию изображений работы по (uploaded_at, id)
+        indexes = [
+            models.Index(fields=['work', 'uploaded_at', 'id'], name='workimage_work_uploaded_idx'),
+            # Очередь непроверенных фото для проверяющих, подтвержденные в индекс не попадают
+            models.Index(
+                fields=['uploaded_at', 'id'],
+                condition=~models.Q(qr_check='verified'),
+                name='workimage_qr_unverified_idx',
+            ),
+        ]
+
+
+
+class IdempotencyKey(models.Model):
+    """Сохраненный ответ на запрос с заголовком Idempotency-Key"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    request_path = models.CharField(max_length=255)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # null - запрос еще выполняется
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+
+class UploadSession(models.Model):
+    """Докачиваемая загрузка фото к работе, части пишутся во временный файл"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    work = models.ForeignKey(Work, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)
@@ -0,0 +1,109 @@
+"""
+Поиск файлов фото, на которые не ссылается ни одна строка WorkImage.
+
+Файлы обходятся через os.scandir без построения полного списка, проверка
+ссылок идет порциями по ORPHANS_CHUNK_SIZE путей, поэтому память не растет
+с числом файлов:
+    1. оригиналы - по индексу WorkImage.image;
+    2. копии вида <sha256>.<копия>.jpg - по индексу content_hash владельца;
+    3. остальные (копии старых файлов и настоящие сироты) - по значениям
+       WorkImage.renditions.
+Свежие файлы (моложе min_age) не трогаются: файл пишется в хранилище до
+коммита строки, которая на него ссылается, а повторная загрузка того же
+содержимого обновляет время изменения общего файла (blobs.store). Перед
+удалением время проверяется еще раз.
+"""
+import os
+import re
+import time
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import WorkImage
+
+ORPHANS_CHUNK_SIZE = 1000
+HASHED_RENDITION = re.compile(r"(?P<hash>[0-9a-f]{64})\.(?P<rendition>\w+)\.jpg")
+
+
+def walk_files(root):
+    """(путь относительно MEDIA_ROOT, DirEntry) для всех файлов под root"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = os.path.relpath(entry.path, settings.MEDIA_ROOT).replace(os.sep, "/")
+                    yield name, entry
+
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def referenced(names):
+    """Подмножество names, на которое ссылаются строки WorkImage"""
+    names = set(names)
+    found = set(WorkImage.objects.filter(image__in=names).values_list("image", flat=True))
+
+    hashes = set()
+    for name in names - found:
+        match = HASHED_RENDITION.fullmatch(os.path.basename(name))
+        if match and match["rendition"] in settings.IMAGE_RENDITIONS:
+            hashes.add(match["hash"])
+    if hashes:
+        for renditions in WorkImage.objects.filter(content_hash__in=hashes).values_list(
+            "renditions", flat=True
+        ):
+            found.update(names.intersection((renditions or {}).values()))
+
+    rest = names - found
+    if rest and settings.IMAGE_RENDITIONS:
+        condition = reduce(
+            or_, (Q(**{f"renditions__{rendition}__in": rest}) for rendition in settings.IMAGE_RENDITIONS)
+        )
+        for renditions in WorkImage.objects.filter(condition).values_list("renditions", flat=True):
+            found.update(rest.intersection((renditions or {}).values()))
+    return found
+
+
+def find_orphans(root, min_age):
+    """
+    Генератор (путь, размер) файлов без ссылок, не моложе min_age
+    (timedelta)
+    """
+    created_before = time.time() - min_age.total_seconds()
+    old_files = (
+        (name, entry, entry.stat(follow_symlinks=False))
+        for name, entry in walk_files(root)
+    )
+    old_files = ((name, entry, stat) for name, entry, stat in old_files if stat.st_mtime < created_before)
+    for chunk in chunks(old_files, ORPHANS_CHUNK_SIZE):
+        found = referenced(name for name, _, _ in chunk)
+        for name, entry, stat in chunk:
+            if name not in found and not touched(entry.path, created_before):
+                yield name, stat.st_size
+
+
+def touched(path, created_before):
+    """Файл успели переиспользовать (blobs.store) или удалить после обхода"""
+    try:
+        return os.stat(path, follow_symlinks=False).st_mtime >= created_before
+    except FileNotFoundError:
+        return True
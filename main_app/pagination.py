@@ -0,0 +1,133 @@
+"""
+Keyset-пагинация по паре (поле, id).
+
+В отличие от OFFSET страница по курсору всегда стоит одинаково: запрос
+продолжает с последней пары (значение, id) по составному индексу. Курсор
+непрозрачный (base64 от JSON), строки с NULL в поле идут в конце выдачи.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q, prefetch_related_objects
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    ordering_field = None
+    descending = True
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Неверный курсор"
+
+    @property
+    def page_size(self):
+        return settings.KEYSET_PAGE_SIZE
+
+    @property
+    def max_page_size(self):
+        return settings.KEYSET_MAX_PAGE_SIZE
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, value, pk):
+        payload = json.dumps([value.isoformat() if value is not None else None, pk])
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, queryset, raw):
+        try:
+            padded = raw + "=" * (-len(raw) % 4)
+            value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            field = queryset.model._meta.get_field(self.ordering_field)
+            return (field.to_python(value) if value is not None else None), int(pk)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_ordering(self):
+        sign = "-" if self.descending else ""
+        return f"{sign}{self.ordering_field}", f"{sign}id"
+
+    def after_cursor(self, value, pk):
+        """
+        Строки строго после (value, pk). Условие по полю - диапазон, поэтому
+        индекс используется для поиска, а не для перебора с начала выдачи
+        """
+        name = self.ordering_field
+        op = "lt" if self.descending else "gt"
+        return Q(**{f"{name}__{op}e": value}) & (
+            Q(**{f"{name}__{op}": value}) | Q(**{f"id__{op}": pk})
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        limit = self.page_size_value + 1
+        field_order, id_order = self.get_ordering()
+        id_op = "lt" if self.descending else "gt"
+
+        # prefetch выполняется один раз для собранной страницы
+        prefetch_lookups = queryset._prefetch_related_lookups
+        queryset = queryset.prefetch_related(None)
+
+        raw_cursor = request.query_params.get(self.cursor_query_param)
+        self.has_cursor = bool(raw_cursor)
+        value, pk = self.decode_cursor(queryset, raw_cursor) if raw_cursor else (None, None)
+
+        # Строки без значения поля идут после всех остальных, отдельным запросом
+        nulls = queryset.filter(**{f"{self.ordering_field}__isnull": True})
+        if raw_cursor and value is None:
+            page = list(nulls.filter(**{f"id__{id_op}": pk}).order_by(id_order)[:limit])
+        else:
+            filled = queryset.filter(**{f"{self.ordering_field}__isnull": False})
+            if raw_cursor:
+                filled = filled.filter(self.after_cursor(value, pk))
+            page = list(filled.order_by(field_order, id_order)[:limit])
+            if len(page) < limit:
+                page += list(nulls.order_by(id_order)[: limit - len(page)])
+
+        self.next_cursor = None
+        if len(page) > self.page_size_value:
+            page = page[: self.page_size_value]
+            last = page[-1]
+            self.next_cursor = self.encode_cursor(getattr(last, self.ordering_field), last.pk)
+        prefetch_related_objects(page, *prefetch_lookups)
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class WorkKeysetPagination(KeysetPagination):
+    """Работы от новых к старым по (start_time, id)"""
+    ordering_field = "start_time"
+
+
+class WorkImageKeysetPagination(KeysetPagination):
+    """Изображения в порядке загрузки по (uploaded_at, id)"""
+    ordering_field = "uploaded_at"
+    descending = False
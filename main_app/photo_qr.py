@@ -0,0 +1,160 @@
+"""
+Проверка QR-кода объекта на фото работ.
+
+После загрузки фото в пуле процессов (QR_PHOTO_VERIFICATION_WORKERS)
+декодируются QR-коды с уменьшенной серой копии: JPEG сразу декодируется в
+уменьшенном масштабе (draft), дальше картинка ужимается до
+QR_PHOTO_VERIFICATION_MAX_SIZE. Процессам передается только путь к файлу,
+база им не нужна. Результат пишется в WorkImage.qr_check:
+    verified - на фото подписанный код объекта работы;
+    mismatch - коды есть, но не того объекта (или неподписанные);
+    missing  - кодов не найдено;
+    failed   - файл не удалось прочитать.
+Пустое значение - фото еще не проверялось.
+
+Модуль импортируется в дочерних процессах до настройки Django, поэтому
+модели и qr.py подключаются внутри функций.
+"""
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+VERIFIED = "verified"
+MISMATCH = "mismatch"
+MISSING = "missing"
+FAILED = "failed"
+
+_executor = None
+
+
+def decode(path, max_size):
+    """Содержимое всех QR-кодов на картинке"""
+    import zxingcpp
+
+    with Image.open(path) as image:
+        image.draft("L", (max_size, max_size))
+        image = image.convert("L")
+    image.thumbnail((max_size, max_size), Image.Resampling.BOX)
+    results = zxingcpp.read_barcodes(image, formats=zxingcpp.BarcodeFormat.QRCode)
+    return [result.text for result in results]
+
+
+def match(payloads, object_id):
+    """Значение qr_check по найденным кодам"""
+    from . import qr
+
+    if any(qr.verify(payload) == object_id for payload in payloads):
+        return VERIFIED
+    return MISMATCH if payloads else MISSING
+
+
+def save_result(image_id, qr_check):
+    from .models import WorkImage
+
+    WorkImage.objects.filter(pk=image_id).update(qr_check=qr_check, qr_checked_at=timezone.now())
+
+
+def check(path, object_id):
+    try:
+        payloads = decode(path, settings.QR_PHOTO_VERIFICATION_MAX_SIZE)
+    except Exception:
+        logger.exception("Не удалось проверить QR-код на фото %s", path)
+        return FAILED
+    return match(payloads, object_id)
+
+
+def _store(image_id, object_id, future):
+    try:
+        payloads = future.result()
+    except Exception:
+        logger.exception("Не удалось проверить QR-код на фото %s", image_id)
+        qr_check = FAILED
+    else:
+        qr_check = match(payloads, object_id)
+    try:
+        save_result(image_id, qr_check)
+    except Exception:
+        logger.exception("Не удалось сохранить проверку QR-кода фото %s", image_id)
+    finally:
+        # Колбэк выполняется в служебном потоке пула со своим соединением
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # Не fork: процесс веб-сервера многопоточный (пул renditions.py)
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.QR_PHOTO_VERIFICATION_WORKERS,
+            mp_context=multiprocessing.get_context(settings.QR_PHOTO_VERIFICATION_START_METHOD),
+        )
+    return _executor
+
+
+def reset_executor(executor):
+    """Убирает сломанный пул (например, процесс убит по памяти), следующий вызов создаст новый"""
+    global _executor
+    if _executor is executor:
+        _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def submit(image_id, path, object_id):
+    for _ in range(2):
+        executor = get_executor()
+        try:
+            future = executor.submit(decode, path, settings.QR_PHOTO_VERIFICATION_MAX_SIZE)
+        except (BrokenProcessPool, RuntimeError):
+            logger.warning("Пул проверки QR-кодов недоступен, пересоздаем")
+            reset_executor(executor)
+            continue
+        future.add_done_callback(partial(_store, image_id, object_id))
+        return
+    logger.error("Не удалось поставить проверку QR-кода фото %s", image_id)
+    save_result(image_id, FAILED)
+
+
+def schedule(image):
+    """
+    Ставит проверку фото в очередь после коммита. image - сохраненный
+    WorkImage с загруженной work, дополнительных запросов нет
+    """
+    if not settings.QR_PHOTO_VERIFICATION_ENABLED:
+        return
+    from django.core.files.storage import default_storage
+
+    path = default_storage.path(image.image.name)
+    object_id = image.work.object_id
+    if settings.QR_PHOTO_VERIFICATION_ASYNC:
+        transaction.on_commit(lambda: submit(image.id, path, object_id), robust=True)
+    else:
+        transaction.on_commit(lambda: save_result(image.id, check(path, object_id)), robust=True)
+
+
+def verify_many(rows, workers=None):
+    """
+    Синхронная проверка пачки (id, путь, ID объекта) в пуле процессов,
+    возвращает {id: qr_check}
+    """
+    rows = list(rows)
+    max_size = settings.QR_PHOTO_VERIFICATION_MAX_SIZE
+    workers = workers or settings.QR_PHOTO_VERIFICATION_WORKERS
+    results = {}
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(rows)))) as executor:
+        futures = [(image_id, object_id, executor.submit(decode, path, max_size)) for image_id, path, object_id in rows]
+        for image_id, object_id, future in futures:
+            try:
+                results[image_id] = match(future.result(), object_id)
+            except Exception:
+                logger.exception("Не удалось проверить QR-код на фото %s", image_id)
+                results[image_id] = FAILED
+    return results
@@ -0,0 +1,167 @@
+"""
+QR-коды объектов в SVG и PNG.
+
+Готовые картинки кэшируются на диске в QR_CACHE_DIR:
+<объект>/<хеш содержимого>-<размер>.<формат>. Хеш берется от содержимого
+кода и параметров кодирования, поэтому при смене содержимого старые файлы
+просто перестают совпадать и удаляются при следующей отрисовке, а повторная
+печать или показ на фронтенде отдают готовый файл без кодирования. Тот же
+хеш служит ETag.
+
+Содержимое кода подписано: <версия ключа>.<ID объекта>.<HMAC-метка>.
+Проверка подписи (verify) не обращается к базе, поэтому поддельные,
+опечатанные и отозванные коды отсекаются до запросов. Ключи лежат в
+QR_SIGNING_KEYS по версиям, новые коды подписываются версией
+QR_SIGNING_KEY_VERSION. Удаление версии из QR_SIGNING_KEYS отзывает все коды
+этой версии, после смены ключа все коды перерисовывает rerender_qr_codes.
+"""
+import base64
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+import segno
+from django.conf import settings
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework.permissions import BasePermission
+
+from .models import Object
+
+FORMATS = {
+    "svg": "image/svg+xml",
+    "png": "image/png",
+}
+
+
+TAG_BYTES = 9
+SIGNATURE_SALT = "main_app.qr"
+
+
+def tag(version, object_id):
+    key = settings.QR_SIGNING_KEYS[version]
+    digest = salted_hmac(SIGNATURE_SALT, f"{version}:{object_id}", secret=key, algorithm="sha256").digest()
+    return base64.urlsafe_b64encode(digest[:TAG_BYTES]).decode()
+
+
+def sign(object_id, version=None):
+    version = version or settings.QR_SIGNING_KEY_VERSION
+    return f"{version}.{object_id}.{tag(version, object_id)}"
+
+
+def verify(code):
+    """
+    ID объекта из подписанного кода или None, если код испорчен, подделан
+    или подписан отозванным ключом. Без запросов к базе
+    """
+    # Код мог быть отсканирован вместе с URL из QR_PAYLOAD_TEMPLATE
+    code = str(code).rstrip("/").rsplit("/", 1)[-1]
+    try:
+        version, object_id, code_tag = code.split(".")
+        version, object_id = int(version), int(object_id)
+    except ValueError:
+        return None
+    if version not in settings.QR_SIGNING_KEYS or object_id < 1:
+        return None
+    if not constant_time_compare(code_tag, tag(version, object_id)):
+        return None
+    return object_id
+
+
+class SignedQRCode(BasePermission):
+    """
+    Проверка подписанного кода до обработчика и до запросов к объекту. Код
+    берется из ?code= или поля code тела запроса и должен совпадать с
+    object_id из URL или поля object, найденный ID кладется в
+    request.qr_object_id. Запросы без кода пропускаются, только пока
+    QR_SIGNED_CODES_REQUIRED выключен
+    """
+    message = "Недействительный QR-код"
+
+    def has_permission(self, request, view):
+        data = request.data if request.method == "POST" and hasattr(request.data, "get") else {}
+        code = request.query_params.get("code") or data.get("code")
+        request.qr_object_id = None
+        if not code:
+            self.message = "Нужен подписанный QR-код объекта"
+            return not settings.QR_SIGNED_CODES_REQUIRED
+
+        request.qr_object_id = verify(code)
+        if request.qr_object_id is None:
+            return False
+        expected = view.kwargs.get("object_id") or data.get("object")
+        return expected in (None, "") or str(expected) == str(request.qr_object_id)
+
+
+def payload(object_id):
+    """Содержимое QR-кода объекта"""
+    return settings.QR_PAYLOAD_TEMPLATE.format(id=object_id, code=sign(object_id))
+
+
+def clamp_size(size):
+    return min(max(int(size), settings.QR_MIN_SIZE), settings.QR_MAX_SIZE)
+
+
+def content_digest(object_id):
+    options = f"{payload(object_id)}\n{settings.QR_ERROR_LEVEL}\n{settings.QR_BORDER}"
+    return hashlib.sha256(options.encode()).hexdigest()[:16]
+
+
+def object_dir(object_id):
+    return os.path.join(settings.QR_CACHE_DIR, str(object_id))
+
+
+def etag(object_id, image_format, size):
+    return f'"{content_digest(object_id)}-{size}-{image_format}"'
+
+
+def encode(object_id, image_format, size):
+    """Кодирует и рисует QR-код, сторона картинки не больше size"""
+    code = segno.make_qr(payload(object_id), error=settings.QR_ERROR_LEVEL)
+    modules, _ = code.symbol_size(scale=1, border=settings.QR_BORDER)
+    # Целый масштаб - модули остаются четкими, без сглаживания
+    scale = max(1, size // modules)
+    buffer = BytesIO()
+    if image_format == "svg":
+        code.save(buffer, kind="svg", scale=scale, border=settings.QR_BORDER, xmldecl=False)
+    else:
+        code.save(buffer, kind="png", scale=scale, border=settings.QR_BORDER)
+    return buffer.getvalue()
+
+
+def render(object_id, image_format="svg", size=None):
+    """Путь к картинке в кэше, при промахе рисует и сохраняет ее"""
+    size = clamp_size(size or settings.QR_DEFAULT_SIZE)
+    digest = content_digest(object_id)
+    directory = object_dir(object_id)
+    path = os.path.join(directory, f"{digest}-{size}.{image_format}")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    data = encode(object_id, image_format, size)
+    # Запись через временный файл: параллельный запрос не увидит половину картинки
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=f"{digest}-", suffix=".tmp", delete=False) as f:
+        f.write(data)
+    os.replace(f.name, path)
+
+    # Картинки со старым содержимым больше не понадобятся
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and not entry.name.startswith(digest):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(entry.path)
+    return path
+
+
+def purge(object_id):
+    shutil.rmtree(object_dir(object_id), ignore_errors=True)
+
+
+@receiver(post_delete, sender=Object)
+def purge_on_object_delete(sender, instance, **kwargs):
+    purge(instance.pk)
@@ -0,0 +1,137 @@
+"""
+Листы с QR-наклейками объектов для печати (PDF или PNG-страницы) и
+массовая перерисовка QR-кодов.
+
+Страница - сетка QR_SHEET_COLUMNS x QR_SHEET_ROWS наклеек: QR-код из кэша
+qr.py и под ним название и адрес объекта. Страницы рисуются параллельно в
+пуле процессов (по процессу на ядро), процессам передаются только ID,
+названия и адреса - база им не нужна.
+
+Модуль импортируется в дочерних процессах до настройки Django, поэтому
+модели и qr.py подключаются внутри функций.
+"""
+import os
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import django
+from django.conf import settings
+from PIL import Image, ImageDraw, ImageFont
+
+MM_PER_INCH = 25.4
+A4_MM = (210, 297)
+ELLIPSIS = "…"
+
+
+def page_size():
+    dpi = settings.QR_SHEET_DPI
+    return tuple(round(mm / MM_PER_INCH * dpi) for mm in A4_MM)
+
+
+@lru_cache(maxsize=None)
+def load_font(size):
+    try:
+        return ImageFont.truetype(settings.QR_SHEET_FONT, size)
+    except OSError:
+        return ImageFont.load_default(size)
+
+
+def fit_text(draw, text, font, width):
+    """Обрезает строку с многоточием, чтобы она влезла в width"""
+    if draw.textlength(text, font=font) <= width:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if draw.textlength(text[:middle] + ELLIPSIS, font=font) <= width:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + ELLIPSIS
+
+
+def render_page(labels):
+    """
+    Рисует одну страницу. labels - список (id, название, адрес), возвращает
+    PNG страницы
+    """
+    from . import qr
+
+    width, height = page_size()
+    columns, rows = settings.QR_SHEET_COLUMNS, settings.QR_SHEET_ROWS
+    margin = settings.QR_SHEET_DPI // 4
+    cell_w = (width - 2 * margin) // columns
+    cell_h = (height - 2 * margin) // rows
+    title_font = load_font(max(cell_h // 14, 10))
+    text_font = load_font(max(cell_h // 20, 8))
+    text_h = title_font.size + text_font.size + margin // 2
+    qr_size = min(cell_w, cell_h - text_h) - margin // 2
+
+    # Черно-белая страница: QR-модули без полутонов, в PDF сжимается CCITT G4, а не JPEG
+    page = Image.new("1", (width, height), 1)
+    draw = ImageDraw.Draw(page)
+    for index, (object_id, name, address) in enumerate(labels):
+        left = margin + index % columns * cell_w
+        top = margin + index // columns * cell_h
+        with Image.open(qr.render(object_id, "png", qr_size)) as code:
+            code = code.convert("1")
+            page.paste(code, (left + (cell_w - code.width) // 2, top))
+        text_top = top + qr_size + margin // 4
+        text_w = cell_w - margin // 2
+        for text, font in ((name, title_font), (address, text_font)):
+            text = fit_text(draw, text, font, text_w)
+            draw.text((left + cell_w // 2, text_top), text, font=font, fill=0, anchor="ma")
+            text_top += font.size + margin // 8
+        # Линия разреза
+        draw.rectangle((left, top - margin // 4, left + cell_w - 1, top + cell_h - margin // 4 - 1), outline=0)
+
+    buffer = BytesIO()
+    page.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def split_pages(labels):
+    per_page = settings.QR_SHEET_COLUMNS * settings.QR_SHEET_ROWS
+    return [labels[i:i + per_page] for i in range(0, len(labels), per_page)]
+
+
+def render_pages(queryset, workers=None):
+    """PNG-страницы для объектов queryset в порядке названий"""
+    labels = list(queryset.order_by("name", "id").values_list("id", "name", "address"))
+    pages = split_pages(labels)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(pages) <= 1:
+        return [render_page(page) for page in pages]
+    with ProcessPoolExecutor(max_workers=min(workers, len(pages)), initializer=django.setup) as executor:
+        return list(executor.map(render_page, pages))
+
+
+def render_codes(object_ids):
+    """Перерисовывает кэш QR-кодов для пачки объектов, возвращает их число"""
+    from . import qr
+
+    for object_id in object_ids:
+        for image_format in qr.FORMATS:
+            qr.render(object_id, image_format)
+    return len(object_ids)
+
+
+def rerender(queryset, workers=None, batch_size=100):
+    """Массовая перерисовка кодов (после смены ключа подписи) в пуле процессов"""
+    object_ids = list(queryset.order_by("id").values_list("id", flat=True))
+    batches = [object_ids[i:i + batch_size] for i in range(0, len(object_ids), batch_size)]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(batches) <= 1:
+        return sum(map(render_codes, batches))
+    with ProcessPoolExecutor(max_workers=min(workers, len(batches)), initializer=django.setup) as executor:
+        return sum(executor.map(render_codes, batches))
+
+
+def to_pdf(pages):
+    images = [Image.open(BytesIO(page)) for page in pages]
+    buffer = BytesIO()
+    images[0].save(
+        buffer, "PDF", save_all=True, append_images=images[1:], resolution=settings.QR_SHEET_DPI
+    )
+    return buffer.getvalue()
@@ -0,0 +1,118 @@
+"""
+Уменьшенные копии (рендишены) изображений работ.
+
+После загрузки фото в фоновом потоке из оригинала делаются JPEG-копии
+размеров из IMAGE_RENDITIONS и кладутся рядом с оригиналом:
+images/photo.jpg -> images/photo.thumb.jpg, images/photo.medium.jpg.
+Пути сохраняются в WorkImage.renditions, пока копий нет - клиенты
+получают оригинал. Строки с общим файлом используют одни и те же копии.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .media import signed_url
+from .models import WorkImage
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def media_url(name):
+    return signed_url(name)
+
+
+def rendition_urls(instance):
+    """Карта {имя: url} для сериализаторов, недостающие копии - оригинал"""
+    if not instance.image:
+        return None
+    original = media_url(instance.image.name)
+    urls = {name: original for name in settings.IMAGE_RENDITIONS}
+    urls.update({name: media_url(path) for name, path in (instance.renditions or {}).items()})
+    urls["original"] = original
+    return urls
+
+
+def rendition_name(original_name, rendition):
+    root, _ = os.path.splitext(original_name)
+    return f"{root}.{rendition}.jpg"
+
+
+def render(source, max_size):
+    image = source.copy()
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=settings.IMAGE_RENDITIONS_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def generate(image_id):
+    """Делает все копии для WorkImage, возвращает карту путей или None"""
+    instance = WorkImage.objects.filter(pk=image_id).only("id", "image", "content_hash").first()
+    if instance is None or not instance.image:
+        return None
+
+    # Файл общий с другими строками (blobs.py) - копии уже могут быть готовы
+    if instance.content_hash:
+        shared = (
+            WorkImage.objects.filter(content_hash=instance.content_hash, image=instance.image.name)
+            .exclude(renditions={})
+            .values_list("renditions", flat=True)
+            .first()
+        )
+        if shared:
+            WorkImage.objects.filter(pk=image_id).update(renditions=shared)
+            return shared
+
+    sizes = sorted(settings.IMAGE_RENDITIONS.items(), key=lambda item: -item[1])
+    with default_storage.open(instance.image.name, "rb") as f:
+        source = Image.open(f)
+        # JPEG можно сразу декодировать в уменьшенном масштабе
+        source.draft("RGB", (sizes[0][1], sizes[0][1]))
+        source = ImageOps.exif_transpose(source).convert("RGB")
+
+    renditions = {}
+    for rendition, max_size in sizes:
+        name = rendition_name(instance.image.name, rendition)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        renditions[rendition] = default_storage.save(name, ContentFile(render(source, max_size)))
+
+    WorkImage.objects.filter(pk=image_id).update(renditions=renditions)
+    return renditions
+
+
+def _run(image_id):
+    try:
+        generate(image_id)
+    except Exception:
+        logger.exception("Не удалось сделать копии изображения %s", image_id)
+    finally:
+        # У потока свое соединение с базой, закрываем его сами
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_RENDITIONS_WORKERS,
+            thread_name_prefix="renditions",
+        )
+    return _executor
+
+
+def schedule(image_id):
+    """Запускает генерацию копий после коммита, не задерживая ответ"""
+    if settings.IMAGE_RENDITIONS_ASYNC:
+        transaction.on_commit(lambda: get_executor().submit(_run, image_id))
+    else:
+        transaction.on_commit(lambda: generate(image_id))
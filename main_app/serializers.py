@@ -1,9 +1,11 @@
 
 from rest_framework import serializers
-from rest_framework.exceptions import PermissionDenied 
 from django.contrib.auth import authenticate
 from django.conf import settings
-from .models import Object, Work, Review, WorkImage
+from .models import Object, Work, Review, WorkImage, UploadSession
+from .renditions import media_url, rendition_urls
+from .compression import compress
+from .upload_handlers import inspect_file
 
 
 class ObjectSerializer(serializers.ModelSerializer):
@@ -42,10 +44,14 @@ class WorkHistorySerializer(serializers.ModelSerializer):
     
 class StartWorkSerializer(serializers.Serializer):
     object = serializers.IntegerField(
-        required=True,
+        required=False,
         help_text="ID объекта для начала работы",
         min_value=1 
     )
+    code = serializers.CharField(
+        required=False,
+        help_text="Подписанное содержимое отсканированного QR-кода (вместо или вместе с object)"
+    )
     name = serializers.CharField(
         required=True,
         help_text="Название выполняемой работы"
@@ -55,11 +61,10 @@ class StartWorkSerializer(serializers.Serializer):
         help_text="Описание выполняемой работы"
     )
 
-    def validate_object(self, value):
-        """Проверяем существование объекта"""
-        if not Object.objects.filter(id=value).exists():
-            raise serializers.ValidationError("Объект с таким ID не существует")
-        return value
+    def validate(self, attrs):
+        if 'object' not in attrs and 'code' not in attrs:
+            raise serializers.ValidationError({'object': ["Нужно указать object или code."]})
+        return attrs
     
 class EndWorkSerializer(serializers.Serializer):
     work_id = serializers.IntegerField(
@@ -68,28 +73,36 @@ class EndWorkSerializer(serializers.Serializer):
         help_text="ID работы для завершения"
     )
 
-    def validate_work_id(self, value):
-        """Проверяем существование работы и права доступа"""
-        try:
-            work = Work.objects.get(id=value)
-            if work.user != self.context['request'].user:
-                raise PermissionDenied("Нет прав для завершения этой работы")
-            if work.end_time is not None:
-                raise serializers.ValidationError("Работа уже завершена")
-            return value
-        except Work.DoesNotExist:
-            raise serializers.ValidationError("Работа не найдена")
-        
+
 class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = ['work', 'supervisor', 'rating', 'comment', 'review_date']
         read_only_fields = ['supervisor']
 
+class CheckedImageField(serializers.ImageField):
+    """
+    Сначала ошибки, найденные при приеме файла (upload_handlers.py): размер,
+    формат и размеры из заголовка. Файлы, принятые без обработчика,
+    проверяются по первым байтам здесь же. Только потом Image.open в ImageField
+    """
+
+    def to_internal_value(self, data):
+        error = getattr(data, "upload_error", None)
+        if error is None and not hasattr(data, "image_size") and hasattr(data, "read"):
+            error = inspect_file(data)
+        if error is not None:
+            raise serializers.ValidationError(error)
+        return super().to_internal_value(data)
+
+
 class WorkImageSerializer(serializers.ModelSerializer):
+    image = CheckedImageField()
+    renditions = serializers.SerializerMethodField(help_text="Ссылки на копии: thumb, medium, original")
+
     class Meta:
         model = WorkImage
-        fields = ('id', 'image', 'uploaded_at', 'work')
+        fields = ('id', 'image', 'renditions', 'uploaded_at', 'work')
         read_only_fields = ('work', 'uploaded_at')
         extra_kwargs = {
             'image': {'required': True}
@@ -97,14 +110,27 @@ class WorkImageSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['image'] = "/media/" + instance.image.url.replace(settings.MEDIA_URL, '', 1)
+        representation['image'] = media_url(instance.image.name)
         return representation
+
+    def get_renditions(self, instance):
+        return rendition_urls(instance)
+
+    def validate(self, attrs):
+        image = attrs['image']
+        if settings.IMAGE_COMPRESSION_ENABLED:
+            attrs['image'], attrs['original_size'], attrs['stored_size'] = compress(image)
+        else:
+            attrs['original_size'] = attrs['stored_size'] = image.size
+        return attrs
     
 
 class WorkImageListSerializer(serializers.ModelSerializer):
+    renditions = serializers.SerializerMethodField(help_text="Ссылки на копии: thumb, medium, original")
+
     class Meta:
         model = WorkImage
-        fields = ('id', 'image', 'uploaded_at', 'work')
+        fields = ('id', 'image', 'renditions', 'uploaded_at', 'work', 'qr_check', 'qr_checked_at')
         read_only_fields = ('work', 'uploaded_at')
         extra_kwargs = {
             'image': {'required': True}
@@ -113,10 +139,13 @@ class WorkImageListSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         if instance.image:
-            representation['image'] = "/media/" + instance.image.url.replace(settings.MEDIA_URL, '', 1)
+            representation['image'] = media_url(instance.image.name)
         else:
             representation['image'] = None 
         return representation
+
+    def get_renditions(self, instance):
+        return rendition_urls(instance)
     
 class ReviewSerializer2(serializers.ModelSerializer):
     class Meta:
@@ -124,18 +153,23 @@ class ReviewSerializer2(serializers.ModelSerializer):
         fields = ['rating', 'comment', 'review_date']
 
 class WorkImageListSerializer2(serializers.ModelSerializer):
+    renditions = serializers.SerializerMethodField(help_text="Ссылки на копии: thumb, medium, original")
+
     class Meta:
         model = WorkImage
-        fields = ('id', 'uploaded_at', 'image')
+        fields = ('id', 'uploaded_at', 'image', 'renditions')
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         if instance.image:
-            representation['image'] = "/media/" + instance.image.url.replace(settings.MEDIA_URL, '', 1)
+            representation['image'] = media_url(instance.image.name)
         else:
             representation['image'] = None 
         return representation
 
+    def get_renditions(self, instance):
+        return rendition_urls(instance)
+
 
 class WorkWithReviewAndImagesSerializer(serializers.ModelSerializer):
     review = ReviewSerializer2(read_only=True, required=False)
@@ -145,3 +179,82 @@ class WorkWithReviewAndImagesSerializer(serializers.ModelSerializer):
         model = Work
         fields = ['id', 'name', 'description', 'start_time', 'end_time', 'review', 'images']
 
+
+
+class SyncEventSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(
+        choices=['start', 'end', 'image'],
+        help_text="Тип события: start, end или image"
+    )
+    client_id = serializers.CharField(
+        required=False, max_length=64,
+        help_text="Идентификатор события на клиенте, на него можно ссылаться через work_ref"
+    )
+    timestamp = serializers.DateTimeField(
+        required=False,
+        help_text="Время сканирования на клиенте"
+    )
+    object = serializers.IntegerField(required=False, min_value=1, help_text="ID объекта (start)")
+    code = serializers.CharField(
+        required=False, max_length=255,
+        help_text="Подписанный QR-код объекта (start), обязателен при QR_SIGNED_CODES_REQUIRED"
+    )
+    name = serializers.CharField(required=False, help_text="Название работы (start)")
+    description = serializers.CharField(required=False, help_text="Описание работы (start)")
+    work_id = serializers.IntegerField(required=False, min_value=1, help_text="ID работы (end, image)")
+    work_ref = serializers.CharField(
+        required=False, max_length=64,
+        help_text="client_id события start из этого же пакета (end, image)"
+    )
+    file = serializers.CharField(
+        required=False,
+        help_text="Имя поля multipart-запроса с изображением (image)"
+    )
+
+    def validate(self, attrs):
+        if attrs['type'] == 'start':
+            required = ['name'] if attrs.get('code') else ['object', 'name']
+        else:
+            required = ['file'] if attrs['type'] == 'image' else []
+            if 'work_id' not in attrs and 'work_ref' not in attrs:
+                raise serializers.ValidationError("Нужно указать work_id или work_ref")
+        missing = [field for field in required if field not in attrs]
+        if missing:
+            raise serializers.ValidationError(
+                {field: ["Обязательное поле."] for field in missing}
+            )
+        return attrs
+
+
+class SyncSerializer(serializers.Serializer):
+    events = SyncEventSerializer(
+        many=True,
+        max_length=settings.SYNC_MAX_EVENTS,
+        help_text="События в порядке их появления на клиенте"
+    )
+
+
+
+class UploadSessionCreateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['filename', 'total_size']
+        extra_kwargs = {
+            'filename': {'help_text': "Имя файла"},
+            'total_size': {'help_text': "Размер файла в байтах"},
+        }
+
+    def validate_total_size(self, value):
+        if not 0 < value <= settings.UPLOAD_SESSION_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Размер файла должен быть от 1 до {settings.UPLOAD_SESSION_MAX_SIZE} байт"
+            )
+        return value
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    upload_id = serializers.UUIDField(source='id', read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['upload_id', 'work', 'filename', 'total_size', 'offset', 'updated_at']
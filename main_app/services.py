@@ -0,0 +1,185 @@
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from rest_framework import status
+
+from .models import Work, Object, ObjectUserStats, ActiveWorkExists, WorkAlreadyEnded
+from .serializers import ObjectSerializer, WorkSerializer
+from . import access, active_work
+
+
+class WorkActionError(Exception):
+    """Нарушение правил работы с объектом, отдается клиенту как {"error": ...}"""
+
+    def __init__(self, error, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(error)
+        self.error = error
+        self.status_code = status_code
+
+
+def client_time(value):
+    """
+    Время события от клиента: из будущего обрезается до текущего, старше
+    SYNC_MAX_EVENT_AGE не принимается
+    """
+    now = timezone.now()
+    if value is None or value > now:
+        return now
+    if value < now - settings.SYNC_MAX_EVENT_AGE:
+        raise WorkActionError("Время события старше допустимого окна офлайн-работы")
+    return value
+
+
+def busy_error(same_object):
+    if same_object:
+        return WorkActionError("Пользователь уже работает на этом объекте.")
+    return WorkActionError("Пользователь уже работает на другом объекте.")
+
+
+def start_work(user, object_id, name, description=None, start_time=None):
+    start_time = client_time(start_time)
+    # Занятость по кэшу проверяется без запросов, промах кэш не заполняет
+    _, cached = active_work.peek(user.id)
+    if cached is not None:
+        raise busy_error(cached.object_id == object_id)
+
+    # Объект, права и активная работа пользователя одним запросом
+    obj = (
+        access.annotate_access(Object.objects.filter(id=object_id), user)
+        .annotate(
+            active_object_id=Subquery(
+                Work.objects.filter(user=user, end_time__isnull=True).values(
+                    "object_id"
+                )[:1]
+            ),
+            last_end_time=Subquery(
+                Work.objects.filter(user=user, end_time__isnull=False)
+                .order_by("-end_time")
+                .values("end_time")[:1]
+            ),
+        )
+        .only("id", "supervisor_id")
+        .first()
+    )
+    if obj is None:
+        raise WorkActionError("Объект не найден", status.HTTP_404_NOT_FOUND)
+
+    if obj.active_object_id is not None:
+        raise busy_error(obj.active_object_id == obj.id)
+
+    if not access.has_access(user, obj):
+        raise WorkActionError(
+            "Нет прав для работы с этим объектом", status.HTTP_403_FORBIDDEN
+        )
+
+    # Офлайн-событие не может начать работу внутри уже завершенной
+    if obj.last_end_time is not None and start_time < obj.last_end_time:
+        raise WorkActionError("Время начала раньше завершения предыдущей работы")
+
+    work = Work(object=obj, user=user)
+    try:
+        work.start_work(name, description, start_time)
+    except ActiveWorkExists:
+        # Параллельный запрос успел открыть работу раньше
+        active_object_id = (
+            Work.objects.filter(user=user, end_time__isnull=True)
+            .values_list("object_id", flat=True)
+            .first()
+        )
+        raise busy_error(active_object_id == obj.id)
+    return work
+
+
+def end_work(user, work_id, end_time=None):
+    work = Work.objects.filter(id=work_id).first()
+    if work is None:
+        raise WorkActionError("Работа не найдена")
+    if work.user_id != user.id:
+        raise WorkActionError(
+            "Нет прав для завершения этой работы", status.HTTP_403_FORBIDDEN
+        )
+    if work.end_time is not None:
+        raise WorkActionError("Работа уже завершена")
+
+    end_time = client_time(end_time)
+    if work.start_time and end_time < work.start_time:
+        raise WorkActionError("Время завершения раньше времени начала работы")
+    try:
+        work.end_work(end_time)
+    except WorkAlreadyEnded:
+        # Параллельный запрос успел завершить работу раньше
+        raise WorkActionError("Работа уже завершена")
+    return work
+
+
+def get_open_work(user, work_id):
+    try:
+        return Work.objects.get(id=work_id, user=user, end_time__isnull=True)
+    except Work.DoesNotExist:
+        raise WorkActionError(
+            "Работа не найдена или недоступна для добавления изображений"
+        )
+
+
+
+def status_queryset(user):
+    """Объекты с признаком назначения пользователя и его счетчиком работ"""
+    return access.annotate_access(Object.objects.all(), user).annotate(
+        user_completed_works=Subquery(
+            ObjectUserStats.objects.filter(object=OuterRef("pk"), user=user).values(
+                "completed_works"
+            )[:1]
+        ),
+    )
+
+
+def object_status(user, obj, active_work):
+    """
+    Статус пользователя на объекте в формате StatusResponseSerializer.
+    obj берется из status_queryset, active_work - открытая работа пользователя
+    """
+    if not access.has_access(user, obj):
+        return {"status": "forbidden"}
+
+    response_data = {
+        "status": None,
+        "stats": {
+            "total_completed_works": obj.completed_works_count,
+            "user_completed_works": obj.user_completed_works or 0,
+        },
+    }
+    if active_work:
+        if active_work.object_id != obj.id:
+            response_data.update(
+                {
+                    "status": "busy",
+                    "active_work": WorkSerializer(active_work).data,
+                    "current_object": ObjectSerializer(active_work.object).data,
+                }
+            )
+        else:
+            response_data.update(
+                {
+                    "status": "work",
+                    "object": ObjectSerializer(obj).data,
+                    "work": WorkSerializer(active_work).data,
+                    "available_actions": ["end"],
+                }
+            )
+    elif user.is_staff or user.is_superuser:
+        response_data.update(
+            {
+                "status": "review",
+                "object": ObjectSerializer(obj).data,
+                "available_actions": ["review"],
+            }
+        )
+    else:
+        response_data.update(
+            {
+                "status": "start",
+                "object": ObjectSerializer(obj).data,
+                "available_actions": ["start"],
+            }
+        )
+    return response_data
@@ -1,3 +1,1179 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.test import APIClient
+
+from auth_app.models import CustomUser
+from .models import Object, Work, WorkImage, Review, UploadSession, ActiveWorkExists, WorkAlreadyEnded
+from . import access, active_work, blobs, checks, counters, media, photo_qr, qr, qr_sheets, services, uploads
+
+
+def make_object(supervisor, workers=(), name="Объект"):
+    obj = Object.objects.create(
+        name=name,
+        address="Адрес",
+        task_description="Задача",
+        deadline=timezone.now() + timedelta(days=1),
+        supervisor=supervisor,
+    )
+    obj.worker.set(workers)
+    return obj
+
+
+def admin_save_work(client, work, **changes):
+    """Сохраняет работу через форму админки"""
+    values = {
+        "name": work.name or "", "description": work.description or "",
+        "object": work.object_id, "user": work.user_id,
+        "start_time": work.start_time, "end_time": work.end_time,
+    }
+    values.update(changes)
+    data = {
+        "workimage_set-TOTAL_FORMS": 0, "workimage_set-INITIAL_FORMS": 0,
+        "workimage_set-MIN_NUM_FORMS": 0, "workimage_set-MAX_NUM_FORMS": 1000,
+    }
+    for field in ("start_time", "end_time"):
+        value = values.pop(field)
+        value = timezone.localtime(value) if value else None
+        data[f"{field}_0"] = value.strftime("%Y-%m-%d") if value else ""
+        data[f"{field}_1"] = value.strftime("%H:%M:%S") if value else ""
+    data.update(values)
+    response = client.post(f"/admin/main_app/work/{work.id}/change/", data)
+    assert response.status_code == 302, response.content
+    work.refresh_from_db()
+
+
+class StartWorkViewTests(TestCase):
+    def setUp(self):
+        caches["active_work"].clear()
+        self.supervisor = CustomUser.objects.create_user("boss", password="x", is_staff=True)
+        self.worker = CustomUser.objects.create_user("worker", password="x")
+        self.obj = make_object(self.supervisor, [self.worker])
+        self.other = make_object(self.supervisor, [self.worker], name="Другой")
+        self.client = APIClient()
+        self.client.force_authenticate(self.worker)
+
+    def start(self, obj):
+        return self.client.post(
+            "/api/v1/start/", {"object": obj.id, "name": "Работа"}, format="json"
+        )
+
+    def test_start_uses_two_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.start(self.obj)
+        self.assertEqual(response.status_code, 201)
+        queries = [q["sql"] for q in ctx.captured_queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(queries), 2)
+        work = Work.objects.get(id=response.data["work_id"])
+        self.assertEqual(work.name, "Работа")
+        self.assertIsNotNone(work.start_time)
+
+    def test_busy_responses(self):
+        self.assertEqual(self.start(self.obj).status_code, 201)
+        response = self.start(self.obj)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], "Пользователь уже работает на этом объекте.")
+        response = self.start(self.other)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], "Пользователь уже работает на другом объекте.")
+
+    def test_forbidden_and_not_found(self):
+        stranger = CustomUser.objects.create_user("stranger", password="x")
+        self.client.force_authenticate(stranger)
+        self.assertEqual(self.start(self.obj).status_code, 403)
+        response = self.client.post(
+            "/api/v1/start/", {"object": 10**6, "name": "Работа"}, format="json"
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_idempotency_key_replays_first_response(self):
+        headers = {"HTTP_IDEMPOTENCY_KEY": "scan-1"}
+        first = self.client.post(
+            "/api/v1/start/", {"object": self.obj.id, "name": "Работа"}, format="json", **headers
+        )
+        with self.assertNumQueries(1):
+            replay = self.client.post(
+                "/api/v1/start/", {"object": self.obj.id, "name": "Работа"}, format="json", **headers
+            )
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay.data, first.data)
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        self.assertEqual(Work.objects.filter(user=self.worker).count(), 1)
+
+    def test_admin_end_time_edit_frees_cached_user(self):
+        self.assertEqual(self.start(self.obj).status_code, 201)
+        work = Work.objects.get(user=self.worker)
+        self.assertEqual(active_work.get_active_work(self.worker.id).id, work.id)
+        admin = APIClient()
+        admin.force_login(CustomUser.objects.create_superuser("admin", password="x"))
+        admin_save_work(admin, work, end_time=timezone.now())
+        self.assertIsNotNone(work.end_time)
+        self.assertEqual(self.start(self.other).status_code, 201)
+
+    def test_end_lost_to_parallel_request_is_rejected(self):
+        self.assertEqual(self.start(self.obj).status_code, 201)
+        work = Work.objects.get(user=self.worker)
+        ended_at = timezone.now() - timedelta(minutes=1)
+        client_time = services.client_time
+
+        def ended_meanwhile(value):
+            # Параллельный запрос завершил работу после проверки end_time
+            Work.objects.filter(id=work.id).update(end_time=ended_at)
+            return client_time(value)
+
+        with mock.patch.object(services, "client_time", side_effect=ended_meanwhile):
+            response = self.client.post("/api/v1/end/", {"work_id": work.id}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"error": "Работа уже завершена"})
+        work.refresh_from_db()
+        self.assertEqual(work.end_time, ended_at)
+
+    def test_constraint_rejects_second_open_work(self):
+        Work(object=self.obj, user=self.worker).start_work("Первая")
+        with self.assertRaises(ActiveWorkExists):
+            Work(object=self.other, user=self.worker).start_work("Вторая")
+
+
+class StartWorkConcurrencyTests(TransactionTestCase):
+    def test_parallel_starts_open_single_work(self):
+        caches["active_work"].clear()
+        supervisor = CustomUser.objects.create_user("boss", password="x", is_staff=True)
+        worker = CustomUser.objects.create_user("worker", password="x")
+        obj = make_object(supervisor, [worker])
+
+        barrier = threading.Barrier(4)
+        results = []
+
+        def scan():
+            client = APIClient()
+            client.force_authenticate(worker)
+            barrier.wait()
+            try:
+                response = client.post(
+                    "/api/v1/start/", {"object": obj.id, "name": "Работа"}, format="json"
+                )
+                results.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=scan) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(Work.objects.filter(user=worker, end_time__isnull=True).count(), 1)
+        self.assertEqual(results.count(201), 1)
+        self.assertEqual(sorted(results), [201, 400, 400, 400])
+
+
+
+class SyncViewTests(TestCase):
+    def setUp(self):
+        caches["active_work"].clear()
+        self.supervisor = CustomUser.objects.create_user("boss", password="x", is_staff=True)
+        self.worker = CustomUser.objects.create_user("worker", password="x")
+        self.obj = make_object(self.supervisor, [self.worker])
+        self.client = APIClient()
+        self.client.force_authenticate(self.worker)
+
+    def test_batch_uses_client_times_and_refs(self):
+        started = timezone.now() - timedelta(hours=2)
+        ended = started + timedelta(hours=1)
+        response = self.client.post(
+            "/api/v1/sync/",
+            {
+                "events": [
+                    {"type": "start", "client_id": "a", "object": self.obj.id,
+                     "name": "Работа", "timestamp": started.isoformat()},
+                    {"type": "start", "object": self.obj.id, "name": "Повтор"},
+                    {"type": "end", "work_ref": "a", "timestamp": ended.isoformat()},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.data["results"]
+        self.assertEqual([r["status"] for r in results], [200, 400, 200])
+        self.assertEqual(results[1]["error"], "Пользователь уже работает на этом объекте.")
+        work = Work.objects.get(id=results[0]["work_id"])
+        self.assertEqual(work.start_time, started)
+        self.assertEqual(work.end_time, ended)
+
+    def test_backdated_events_are_rejected(self):
+        now = timezone.now()
+        previous = Work(object=self.obj, user=self.worker)
+        previous.start_work("Вчера", start_time=now - timedelta(hours=5))
+        previous.end_work(now - timedelta(hours=3))
+        response = self.client.post(
+            "/api/v1/sync/",
+            {
+                "events": [
+                    {"type": "start", "object": self.obj.id, "name": "Давно",
+                     "timestamp": (now - settings.SYNC_MAX_EVENT_AGE - timedelta(hours=1)).isoformat()},
+                    {"type": "start", "object": self.obj.id, "name": "Внутри прошлой",
+                     "timestamp": (now - timedelta(hours=4)).isoformat()},
+                ]
+            },
+            format="json",
+        )
+        results = response.data["results"]
+        self.assertEqual([r["status"] for r in results], [400, 400])
+        self.assertEqual(results[0]["error"], "Время события старше допустимого окна офлайн-работы")
+        self.assertEqual(results[1]["error"], "Время начала раньше завершения предыдущей работы")
+        self.assertEqual(Work.objects.filter(user=self.worker).count(), 1)
+
+
+class ObjectStatusViewTests(TestCase):
+    def setUp(self):
+        caches["active_work"].clear()
+        self.supervisor = CustomUser.objects.create_user("boss", password="x", is_staff=True)
+        self.worker = CustomUser.objects.create_user("worker", password="x")
+        self.obj = make_object(self.supervisor, [self.worker])
+        self.client = APIClient()
+        self.client.force_authenticate(self.worker)
+
+    def status_of(self, obj):
+        return self.client.get(f"/api/v1/object/status/{obj.id}/")
+
+    def test_active_work_cache_invalidated_on_start_and_end(self):
+        self.assertEqual(self.status_of(self.obj).data["status"], "start")
+        work = Work(object=self.obj, user=self.worker)
+        work.start_work("Работа")
+        self.assertEqual(self.status_of(self.obj).data["status"], "work")
+        self.assertEqual(self.status_of(self.obj).data["status"], "work")
+        work.end_work()
+        self.assertEqual(self.status_of(self.obj).data["status"], "start")
+        self.assertGreater(active_work.stats()["hits"], 0)
+
+    def test_deploy_check_warns_about_process_local_cache(self):
+        self.assertEqual([w.id for w in checks.check_active_work_cache(None)], ["main_app.W001"])
+        shared = {**settings.CACHES, "active_work": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": tempfile.mkdtemp(),
+        }}
+        self.addCleanup(shutil.rmtree, shared["active_work"]["LOCATION"], ignore_errors=True)
+        with override_settings(CACHES=shared):
+            self.assertEqual(checks.check_active_work_cache(None), [])
+
+    def test_completion_counters(self):
+        for _ in range(2):
+            work = Work(object=self.obj, user=self.worker)
+            work.start_work("Работа")
+            work.end_work()
+        # Повторное завершение (устаревшая копия работы) не считается и
+        # возвращает время из базы
+        stale = Work.objects.get(id=work.id)
+        stale.end_time = None
+        with self.assertRaises(WorkAlreadyEnded):
+            stale.end_work(timezone.now() + timedelta(hours=1))
+        self.assertEqual(stale.end_time, Work.objects.get(id=work.id).end_time)
+        stats = self.status_of(self.obj).data["stats"]
+        self.assertEqual(stats, {"total_completed_works": 2, "user_completed_works": 2})
+
+        work.delete()
+        self.assertEqual(counters.find_mismatches(), [])
+        stats = self.status_of(self.obj).data["stats"]
+        self.assertEqual(stats["total_completed_works"], 1)
+
+        Object.objects.update(completed_works_count=7)
+        self.assertEqual(len(counters.find_mismatches()), 1)
+        counters.rebuild()
+        self.assertEqual(counters.find_mismatches(), [])
+
+    def test_admin_edits_keep_counters_consistent(self):
+        admin = APIClient()
+        admin.force_login(CustomUser.objects.create_superuser("admin", password="x"))
+        work = Work(object=self.obj, user=self.worker)
+        work.start_work("Работа")
+
+        admin_save_work(admin, work, end_time=timezone.now())
+        self.obj.refresh_from_db()
+        self.assertEqual(self.obj.completed_works_count, 1)
+        admin_save_work(admin, work, name="Переименована")
+        other = make_object(self.supervisor, [self.worker], name="Другой")
+        admin_save_work(admin, work, object=other.id)
+        self.assertEqual(counters.find_mismatches(), [])
+        admin_save_work(admin, work, end_time=None)
+        self.assertEqual(counters.find_mismatches(), [])
+        other.refresh_from_db()
+        self.assertEqual(other.completed_works_count, 0)
+
+    def test_batch_status_constant_queries(self):
+        objects = [make_object(self.supervisor, [self.worker], name=f"Объект {i}") for i in range(20)]
+        foreign = make_object(self.supervisor, name="Чужой")
+        ids = ",".join(str(obj.id) for obj in [*objects, foreign]) + ",999999"
+        active_work.get_active_work(self.worker.id)
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/v1/object/status/batch/?ids={ids}")
+        results = response.data["results"]
+        self.assertEqual(len(results), 22)
+        self.assertEqual(results[0]["status"], "start")
+        self.assertEqual(results[0], {"object_id": objects[0].id, **self.status_of(objects[0]).data})
+        self.assertEqual(results[-2]["status"], "forbidden")
+        self.assertEqual(results[-1]["status"], "not_found")
+
+        self.client.force_authenticate(self.supervisor)
+        response = self.client.get("/api/v1/object/status/batch/?supervised=true")
+        self.assertEqual(len(response.data["results"]), 22)
+        self.assertTrue(all(r["status"] == "review" for r in response.data["results"]))
+
+
+class ObjectAccessTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.supervisor = CustomUser.objects.create_user("boss", password="x", is_staff=True)
+        self.worker = CustomUser.objects.create_user("worker", password="x")
+        self.obj = make_object(self.supervisor)
+
+    def test_cached_access_follows_assignment_changes(self):
+        self.assertFalse(access.can_access_object(self.worker, self.obj.id))
+        self.obj.worker.add(self.worker)
+        self.assertTrue(access.can_access_object(self.worker, self.obj.id))
+        with self.assertNumQueries(0):
+            self.assertTrue(access.can_access_object(self.worker, self.obj.id))
+        self.worker.assigned_objects.remove(self.obj)
+        self.assertFalse(access.can_access_object(self.worker, self.obj.id))
+
+        self.assertTrue(access.can_access_object(self.supervisor, self.obj.id))
+        self.obj.supervisor = self.worker
+        self.obj.save()
+        self.assertFalse(access.can_access_object(self.supervisor, self.obj.id))
+        self.assertTrue(access.can_access_object(self.worker, self.obj.id))
+
+
+class WorkHistoryQueriesTests(TestCase):
+    def test_history_and_user_works_query_count_is_constant(self):
+        supervisor = CustomUser.objects.create_user("boss", password="x", is_staff=True)
+        worker = CustomUser.objects.create_user("worker", password="x")
+        obj = make_object(supervisor, [worker])
+        for i in range(5):
+            work = Work.objects.create(object=obj, user=worker, name=f"Работа {i}",
+                                       start_time=timezone.now(), end_time=timezone.now())
+            WorkImage.objects.create(work=work, image=f"images/{i}.jpg")
+            if i % 2:
+                Review.objects.create(work=work, supervisor=supervisor, rating=5)
+
+        client = APIClient()
+        client.force_authenticate(worker)
+        # работы, работы без start_time для неполной страницы, изображения
+        with self.assertNumQueries(3):
+            response = client.get(f"/api/v1/object/work-history/{obj.id}/")
+        works = response.data["results"]
+        self.assertEqual(len(works), 5)
+        self.assertEqual(len(works[0]["images"]), 1)
+        self.assertEqual(sum(work["review"] is not None for work in works), 2)
+        with self.assertNumQueries(3):
+            response = client.get("/api/v1/user/works/")
+        self.assertEqual(len(response.data["results"]), 5)
+
+
+class KeysetPaginationTests(TestCase):
+    def test_pages_cover_all_works_including_null_start_time(self):
+        supervisor = CustomUser.objects.create_user("boss", password="x", is_staff=True)
+        obj = make_object(supervisor, [supervisor])
+        now = timezone.now()
+        expected = []
+        for i in range(7):
+            start_time = None if i in (2, 5) else now - timedelta(minutes=i % 3)
+            work = Work.objects.create(object=obj, user=supervisor, start_time=start_time, end_time=now)
+            expected.append(work.id)
+
+        client = APIClient()
+        client.force_authenticate(supervisor)
+        url = f"/api/v1/object/work-history/{obj.id}/?page_size=2"
+        seen = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            seen += [work["id"] for work in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(sorted(seen), sorted(expected))
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertIsNone(Work.objects.get(id=seen[-1]).start_time)
+
+        response = client.get(f"/api/v1/object/work-history/{obj.id}/?cursor=broken")
+        self.assertEqual(response.status_code, 404)
+
+
+class WorkHistoryExportTests(TestCase):
+    def test_streams_ndjson_and_csv(self):
+        supervisor = CustomUser.objects.create_user("boss", password="x", is_staff=True)
+        worker = CustomUser.objects.create_user("worker", password="x")
+        obj = make_object(supervisor, [worker])
+        for i in range(3):
+            work = Work.objects.create(object=obj, user=worker, name=f"Работа {i}",
+                                       start_time=timezone.now(), end_time=timezone.now())
+            WorkImage.objects.create(work=work, image=f"images/{i}.jpg")
+        Review.objects.create(work=work, supervisor=supervisor, rating=4, comment="Хорошо")
+
+        client = APIClient()
+        client.force_authenticate(worker)
+        url = f"/api/v1/object/work-history/{obj.id}/export/"
+        self.assertEqual(client.get(url).status_code, 403)
+
+        client.force_authenticate(supervisor)
+        response = client.get(url)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([row["name"] for row in rows], ["Работа 0", "Работа 1", "Работа 2"])
+        self.assertEqual(rows[2]["review"]["rating"], 4)
+        self.assertTrue(rows[0]["images"][0].startswith("/api/v1/media/images/0.jpg?expires="))
+
+        response = client.get(url + "?type=csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "name", "description"])
+        self.assertEqual(len(lines), 4)
+
+
+def make_jpeg(size=(1600, 1200), color="red"):
+    buffer = BytesIO()
+    PILImage.new("RGB", size, color).save(buffer, "JPEG")
+    return SimpleUploadedFile("photo.jpg", buffer.getvalue(), content_type="image/jpeg")
+
+
+class MediaTestCase(TestCase):
+    def setUp(self):
+        caches["active_work"].clear()
+        self.media_root = tempfile.mkdtemp()
+        self.media_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_override.enable()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.addCleanup(self.media_override.disable)
+
+        self.supervisor = CustomUser.objects.create_user("boss", password="x", is_staff=True)
+        self.worker = CustomUser.objects.create_user("worker", password="x")
+        self.obj = make_object(self.supervisor, [self.worker])
+        self.work = Work(object=self.obj, user=self.worker)
+        self.work.start_work("Работа")
+        self.client = APIClient()
+        self.client.force_authenticate(self.worker)
+
+    def upload(self, image=None):
+        return self.client.post(
+            f"/api/v1/image_work/{self.work.id}/", {"image": image or make_jpeg()}, format="multipart"
+        )
+
+
+@override_settings(IMAGE_RENDITIONS_ASYNC=False)
+class RenditionsTests(MediaTestCase):
+    def test_upload_creates_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["renditions"]["thumb"], response.data["image"])
+
+        image = WorkImage.objects.get(id=response.data["id"])
+        self.assertEqual(set(image.renditions), {"thumb", "medium"})
+        with default_storage.open(image.renditions["thumb"]) as f:
+            self.assertEqual(max(PILImage.open(f).size), 200)
+
+        response = self.client.get(f"/api/v1/image_work/{self.work.id}/list/")
+        renditions = response.data["results"][0]["renditions"]
+        self.assertTrue(renditions["thumb"].split("?")[0].endswith(".thumb.jpg"))
+        self.assertTrue(renditions["medium"].split("?")[0].endswith(".medium.jpg"))
+
+    def test_backfill_command(self):
+        response = self.upload()
+        self.assertEqual(WorkImage.objects.get(id=response.data["id"]).renditions, {})
+        call_command("backfill_renditions", workers=1, stdout=StringIO())
+        self.assertEqual(set(WorkImage.objects.get(id=response.data["id"]).renditions), {"thumb", "medium"})
+
+
+@override_settings(IMAGE_COMPRESSION_ENABLED=True, IMAGE_COMPRESSION_MAX_DIMENSION=800)
+class CompressionTests(MediaTestCase):
+    def test_upload_is_rotated_downscaled_and_stripped(self):
+        exif = PILImage.Exif()
+        exif[274] = 6  # повернуть на 90 градусов
+        exif[271] = "Phone"
+        exif.get_ifd(0x8769)[36867] = "2025:01:02 03:04:05"
+        buffer = BytesIO()
+        PILImage.effect_noise((1600, 1200), 64).convert("RGB").save(buffer, "JPEG", quality=95, exif=exif)
+        upload = SimpleUploadedFile("photo.jpg", buffer.getvalue(), content_type="image/jpeg")
+
+        response = self.upload(upload)
+        self.assertEqual(response.status_code, 201)
+        image = WorkImage.objects.get(id=response.data["id"])
+        self.assertEqual(image.original_size, len(buffer.getvalue()))
+        self.assertGreater(image.bytes_saved, 0)
+        self.assertEqual(image.stored_size, image.image.size)
+        with image.image.open() as f:
+            stored = PILImage.open(f)
+            self.assertEqual(stored.size, (600, 800))
+            stored_exif = stored.getexif()
+            self.assertNotIn(274, stored_exif)
+            self.assertNotIn(271, stored_exif)
+            self.assertEqual(stored_exif.get_ifd(0x8769)[36867], "2025:01:02 03:04:05")
+
+
+    @override_settings(IMAGE_COMPRESSION_QUALITY=95)
+    def test_small_photo_with_exif_is_still_stripped(self):
+        exif = PILImage.Exif()
+        exif[271] = "Phone"
+        exif.get_ifd(0x8825)[1] = "N"  # GPS
+        buffer = BytesIO()
+        PILImage.effect_noise((400, 300), 64).convert("RGB").save(buffer, "JPEG", quality=20, exif=exif)
+        response = self.upload(SimpleUploadedFile("photo.jpg", buffer.getvalue(), content_type="image/jpeg"))
+        image = WorkImage.objects.get(id=response.data["id"])
+        self.assertGreaterEqual(image.stored_size, image.original_size)
+        with image.image.open() as f:
+            stored_exif = PILImage.open(f).getexif()
+        self.assertNotIn(271, stored_exif)
+        self.assertNotIn(0x8825, stored_exif)
+
+    def test_transparent_png_gets_white_background(self):
+        buffer = BytesIO()
+        logo = PILImage.effect_noise((800, 800), 64).convert("RGBA")
+        logo.paste((0, 0, 0, 0), (0, 0, 400, 800))
+        logo.save(buffer, "PNG")
+        response = self.upload(SimpleUploadedFile("logo.png", buffer.getvalue(), content_type="image/png"))
+        image = WorkImage.objects.get(id=response.data["id"])
+        self.assertTrue(image.image.name.endswith(".jpg"))
+        with image.image.open() as f:
+            self.assertGreater(min(PILImage.open(f).convert("RGB").getpixel((10, 10))), 240)
+
+
+class ResumableUploadTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sessions_override = override_settings(
+            UPLOAD_SESSIONS_DIR=os.path.join(self.media_root, "sessions")
+        )
+        self.sessions_override.enable()
+        self.addCleanup(self.sessions_override.disable)
+
+    def put_chunk(self, upload_id, offset, data):
+        return self.client.generic(
+            "PUT", f"/api/v1/uploads/{upload_id}/", data,
+            content_type="application/octet-stream", HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_chunks_resume_and_finalize(self):
+        content = make_jpeg().read()
+        response = self.client.post(
+            f"/api/v1/image_work/{self.work.id}/uploads/",
+            {"filename": "photo.jpg", "total_size": len(content)}, format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.data["upload_id"]
+
+        half = len(content) // 2
+        self.assertEqual(self.put_chunk(upload_id, 0, content[:half]).data["offset"], half)
+        conflict = self.put_chunk(upload_id, 0, content[:half])
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(conflict.data["offset"], half)
+        self.assertEqual(self.client.post(f"/api/v1/uploads/{upload_id}/finalize/").status_code, 400)
+        self.assertEqual(self.put_chunk(upload_id, half, content[half:]).data["offset"], len(content))
+
+        response = self.client.post(f"/api/v1/uploads/{upload_id}/finalize/")
+        self.assertEqual(response.status_code, 201)
+        image = WorkImage.objects.get(id=response.data["id"])
+        self.assertEqual(image.work_id, self.work.id)
+        with image.image.open() as f:
+            self.assertEqual(f.read(), content)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, "sessions")), [])
+
+    def create_session(self, content):
+        response = self.client.post(
+            f"/api/v1/image_work/{self.work.id}/uploads/",
+            {"filename": "photo.jpg", "total_size": len(content)}, format="json",
+        )
+        return response.data["upload_id"]
+
+    def test_offset_is_rechecked_after_body_is_received(self):
+        content = make_jpeg().read()
+        upload_id = self.create_session(content)
+        receive_chunk = uploads.receive_chunk
+
+        def concurrent_put(session, *args):
+            # Пока тело части идет по сети, другой запрос успевает дописать файл
+            result = receive_chunk(session, *args)
+            UploadSession.objects.filter(id=session.id).update(offset=10)
+            return result
+
+        with mock.patch.object(uploads, "receive_chunk", side_effect=concurrent_put):
+            response = self.put_chunk(upload_id, 0, content[:100])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["offset"], 10)
+        self.assertEqual(os.path.getsize(uploads.session_path(UploadSession.objects.get())), 0)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, "sessions")), [f"{upload_id}.part"])
+
+    def test_session_is_finalized_once(self):
+        content = make_jpeg().read()
+        upload_id = self.create_session(content)
+        self.put_chunk(upload_id, 0, content)
+        self.assertEqual(self.client.post(f"/api/v1/uploads/{upload_id}/finalize/").status_code, 201)
+        self.assertEqual(self.client.post(f"/api/v1/uploads/{upload_id}/finalize/").status_code, 404)
+        self.assertEqual(self.client.delete(f"/api/v1/uploads/{upload_id}/").status_code, 404)
+        self.assertEqual(WorkImage.objects.filter(work=self.work).count(), 1)
+
+    def test_purge_expired_sessions(self):
+        session = UploadSession(user=self.worker, work=self.work, filename="a.jpg", total_size=10)
+        uploads.create_file(session)
+        session.updated_at = timezone.now() - timedelta(days=2)
+        session.save()
+        call_command("purge_upload_sessions", stdout=StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(uploads.session_path(session)))
+
+
+class BatchUploadTests(MediaTestCase):
+    def test_batch_upload_reports_each_file(self):
+        files = [make_jpeg(), SimpleUploadedFile("notes.txt", b"not an image"), make_jpeg(color="blue")]
+        with self.assertNumQueries(2):  # открытая работа и один INSERT
+            response = self.client.post(
+                f"/api/v1/image_work/{self.work.id}/batch/", {"images": files}, format="multipart"
+            )
+        self.assertEqual(response.status_code, 207)
+        results = response.data["results"]
+        self.assertEqual([r["status"] for r in results], [201, 400, 201])
+        self.assertIn("image", results[1]["errors"])
+        ids = [results[0]["image"]["id"], results[2]["image"]["id"]]
+        self.assertEqual(
+            list(WorkImage.objects.filter(work=self.work).order_by("id").values_list("id", flat=True)), ids
+        )
+
+
+class ImageDedupTests(MediaTestCase):
+    def age(self, path, days=3):
+        old = time.time() - days * 24 * 3600
+        os.utime(path, (old, old))
+
+    def test_same_photo_is_stored_once_and_collected_after_last_reference(self):
+        first = self.upload(make_jpeg()).data
+        second = self.upload(make_jpeg()).data
+        self.assertEqual(first["image"], second["image"])
+        first_image = WorkImage.objects.get(id=first["id"])
+        path = first_image.image.path
+        self.assertEqual(len(first_image.content_hash), 64)
+        self.assertEqual(len(os.listdir(os.path.dirname(path))), 1)
+
+        for image_id in (first["id"], second["id"]):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete(f"/api/v1/image_work/{self.work.id}/{image_id}/delete/")
+        # Общий файл удаляет только сборщик файлов без ссылок
+        self.assertTrue(os.path.exists(path))
+        self.age(path)
+        call_command("purge_orphaned_media", stdout=StringIO())
+        self.assertFalse(os.path.exists(path))
+
+    def test_reused_file_is_not_purged_before_its_row_commits(self):
+        data = self.upload(make_jpeg()).data
+        path = WorkImage.objects.get(id=data["id"]).image.path
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/api/v1/image_work/{self.work.id}/{data['id']}/delete/")
+        self.age(path)
+
+        # Строка новой загрузки еще не сохранена, файл уже переиспользован
+        pending = WorkImage(work=self.work, image=make_jpeg())
+        blobs.store(pending)
+        self.assertEqual(pending.image.path, path)
+        call_command("purge_orphaned_media", stdout=StringIO())
+        self.assertTrue(os.path.exists(path))
+
+    def test_concurrent_upload_of_same_photo_keeps_one_file(self):
+        data = self.upload(make_jpeg()).data
+        path = WorkImage.objects.get(id=data["id"]).image.path
+        # Вторая загрузка не увидела файл и записала свой
+        pending = WorkImage(work=self.work, image=make_jpeg())
+        with mock.patch.object(blobs.os, "utime", side_effect=FileNotFoundError):
+            blobs.store(pending)
+        self.assertEqual(pending.image.path, path)
+        self.assertEqual(os.listdir(os.path.dirname(path)), [os.path.basename(path)])
+
+
+class WorkImageFileTests(MediaTestCase):
+    def test_file_is_served_to_owner_only(self):
+        image_id = self.upload().data["id"]
+        url = f"/api/v1/image_work/{self.work.id}/{image_id}/file/"
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(b"".join(response.streaming_content)[:2], b"\xff\xd8")
+        self.assertEqual(response["Cache-Control"], f"private, max-age={settings.MEDIA_URL_TTL}, immutable")
+
+        stranger = CustomUser.objects.create_user("stranger", password="x")
+        self.client.force_authenticate(stranger)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT=True)
+    def test_transfer_is_handed_to_nginx(self):
+        image = WorkImage.objects.get(id=self.upload().data["id"])
+        response = self.client.get(f"/api/v1/image_work/{self.work.id}/{image.id}/file/?rendition=thumb")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected_media/" + image.image.name)
+        self.assertEqual(response.content, b"")
+
+
+class SignedMediaTests(MediaTestCase):
+    def test_signed_url_is_served_without_queries(self):
+        url = self.upload().data["image"]
+        self.assertTrue(url.startswith("/api/v1/media/images/"))
+        self.client.logout()
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Cache-Control"].startswith("private, max-age="))
+        self.assertTrue(response["Cache-Control"].endswith(", immutable"))
+
+        self.assertEqual(self.client.get(url[:-2] + "xx").status_code, 403)
+        self.assertEqual(self.client.get(url.split("?")[0]).status_code, 403)
+
+    def test_url_is_stable_within_bucket_and_expires(self):
+        name = "images/photo.jpg"
+        self.assertEqual(media.signed_url(name), media.signed_url(name))
+        expires = int(time.time()) - 1
+        self.assertFalse(media.verify(name, expires, media.sign(name, expires)))
+
+    def test_old_key_signatures_stay_valid(self):
+        expires = media.current_expiry()
+        signature = media.sign("images/photo.jpg", expires)
+        with override_settings(SECRET_KEY="new-key", SECRET_KEY_FALLBACKS=[settings.SECRET_KEY]):
+            self.assertTrue(media.verify("images/photo.jpg", expires, signature))
+
+
+class RelocateMediaTests(MediaTestCase):
+    def test_legacy_files_are_moved_and_rerun_is_noop(self):
+        data = make_jpeg().read()
+        legacy = WorkImage.objects.create(
+            work=self.work, image=default_storage.save("images/photo.jpg", SimpleUploadedFile("photo.jpg", data))
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("relocate_media", stdout=StringIO())
+        legacy.refresh_from_db()
+        self.assertTrue(legacy.image.name.startswith(f"images/{legacy.content_hash[:2]}/"))
+        self.assertFalse(default_storage.exists("images/photo.jpg"))
+        with default_storage.open(legacy.image.name) as f:
+            self.assertEqual(f.read(), data)
+
+        with override_settings(MEDIA_PATH_STRATEGY="date"):
+            out = StringIO()
+            call_command("relocate_media", stdout=out)
+            legacy.refresh_from_db()
+            self.assertRegex(legacy.image.name, r"^images/\d{4}/\d{2}/\d{2}/[0-9a-f]{64}\.jpg$")
+            out = StringIO()
+            call_command("relocate_media", stdout=out)
+            self.assertIn("перенесено 0, на месте 1", out.getvalue())
+
+
+    def test_placed_file_without_hash_is_kept(self):
+        data = make_jpeg().read()
+        digest = hashlib.sha256(data).hexdigest()
+        name = default_storage.save(blobs.blob_name(digest, "photo.jpg"), SimpleUploadedFile("photo.jpg", data))
+        image = WorkImage.objects.create(work=self.work, image=name)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("relocate_media", stdout=StringIO())
+        image.refresh_from_db()
+        self.assertEqual((image.image.name, image.content_hash), (name, digest))
+        self.assertTrue(default_storage.exists(name))
+
+
+class RelocateSharedFileTests(TransactionTestCase):
+    """Старые файлы удаляются сразу после коммита каждой строки, как в реальном запуске"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        user = CustomUser.objects.create_user("worker", password="x")
+        self.work = Work.objects.create(object=make_object(user), user=user, start_time=timezone.now())
+
+    def test_rows_sharing_a_file_are_counted_as_moved(self):
+        name = default_storage.save("images/photo.jpg", make_jpeg())
+        WorkImage.objects.bulk_create([WorkImage(work=self.work, image=name) for _ in range(2)])
+        out, err = StringIO(), StringIO()
+        call_command("relocate_media", stdout=out, stderr=err)
+        self.assertIn("перенесено 2, на месте 0, без файла 0", out.getvalue())
+        self.assertEqual(err.getvalue(), "")
+        names = set(WorkImage.objects.values_list("image", flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertTrue(default_storage.exists(names.pop()))
+        self.assertFalse(default_storage.exists(name))
+
+
+@override_settings(IMAGE_RENDITIONS_ASYNC=False)
+class OrphanedMediaTests(MediaTestCase):
+    def test_only_old_unreferenced_files_are_removed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = WorkImage.objects.get(id=self.upload().data["id"])
+        image.refresh_from_db()
+        legacy = WorkImage.objects.create(work=self.work, image="images/legacy.jpg",
+                                          renditions={"thumb": "images/legacy.thumb.jpg"})
+        orphan = "images/2024/01/01/lost.jpg"
+        for name in ["images/legacy.jpg", "images/legacy.thumb.jpg", orphan, "images/fresh.jpg"]:
+            default_storage.save(name, SimpleUploadedFile("x.jpg", b"data"))
+        old = time.time() - 3 * 24 * 3600
+        for name in [image.image.name, *image.renditions.values(), *legacy.renditions.values(),
+                     legacy.image.name, orphan]:
+            os.utime(default_storage.path(name), (old, old))
+
+        out = StringIO()
+        call_command("purge_orphaned_media", dry_run=True, stdout=out)
+        self.assertEqual(out.getvalue().splitlines()[0], orphan)
+        self.assertIn("Найдено файлов без ссылок: 1", out.getvalue())
+        self.assertTrue(default_storage.exists(orphan))
+
+        call_command("purge_orphaned_media", stdout=StringIO())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists("images/fresh.jpg"))
+        self.assertTrue(default_storage.exists(image.renditions["thumb"]))
+        self.assertTrue(default_storage.exists("images/legacy.thumb.jpg"))
+
+    def test_dir_outside_media_root_is_rejected(self):
+        outside = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside, ignore_errors=True)
+        os.symlink(outside, os.path.join(self.media_root, "link"))
+        for directory in ("../", outside, "images/../..", "link"):
+            with self.assertRaises(CommandError):
+                call_command("purge_orphaned_media", dir=directory, dry_run=True, stdout=StringIO())
+        call_command("purge_orphaned_media", dir="images/../images", dry_run=True, stdout=StringIO())
+
+
+class StreamingUploadValidationTests(MediaTestCase):
+    def test_upload_is_hashed_while_streaming(self):
+        upload = make_jpeg()
+        data = upload.read()
+        upload.seek(0)
+        response = self.upload(upload)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(WorkImage.objects.get(id=response.data["id"]).content_hash,
+                         hashlib.sha256(data).hexdigest())
+
+    @override_settings(UPLOAD_IMAGE_MAX_SIZE=10 * 1024)
+    def test_oversized_file_is_rejected(self):
+        buffer = BytesIO()
+        PILImage.effect_noise((400, 400), 64).convert("RGB").save(buffer, "JPEG", quality=95)
+        upload = SimpleUploadedFile("big.jpg", buffer.getvalue(), content_type="image/jpeg")
+        response = self.upload(upload)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Файл больше", str(response.data["image"][0]))
+
+    @override_settings(UPLOAD_IMAGE_MAX_PIXELS=1000 * 1000)
+    def test_dimensions_are_checked_from_header(self):
+        response = self.upload(make_jpeg(size=(1600, 1200)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("1600x1200", str(response.data["image"][0]))
+
+    def test_unknown_format_is_rejected(self):
+        response = self.upload(SimpleUploadedFile("photo.jpg", b"%PDF-1.7 " + b"0" * 100))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Неподдерживаемый формат", str(response.data["image"][0]))
+
+
+class QRCacheTestCase(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.qr_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.qr_dir, ignore_errors=True)
+        qr_override = override_settings(QR_CACHE_DIR=self.qr_dir)
+        qr_override.enable()
+        self.addCleanup(qr_override.disable)
+
+
+class QRCodeTests(QRCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.supervisor)
+
+    def test_png_and_svg_are_cached_with_etag(self):
+        url = f"/api/v1/object/{self.obj.id}/qr/"
+        response = self.client.get(url + "?type=png&size=200")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        image = PILImage.open(BytesIO(b"".join(response.streaming_content)))
+        self.assertLessEqual(image.size[0], 200)
+
+        etag = response["ETag"]
+        response = self.client.get(url + "?type=png&size=200", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(url)
+        self.assertEqual(response["Content-Type"], "image/svg+xml")
+        self.assertIn(b"<svg", b"".join(response.streaming_content))
+        self.assertEqual(len(os.listdir(os.path.join(self.qr_dir, str(self.obj.id)))), 2)
+
+    def test_payload_change_invalidates_cache(self):
+        first = qr.render(self.obj.id, "png")
+        with override_settings(QR_PAYLOAD_TEMPLATE="obj-{id}"):
+            second = qr.render(self.obj.id, "png")
+        self.assertNotEqual(first, second)
+        self.assertFalse(os.path.exists(first))
+
+    def test_stranger_and_worker_get_403(self):
+        url = f"/api/v1/object/{self.obj.id}/qr/"
+        self.client.force_authenticate(CustomUser.objects.create_user("stranger", password="x"))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        # Рабочий объекта не может распечатать код и отметиться не на месте
+        self.client.force_authenticate(self.worker)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_object_supervisor_gets_code(self):
+        supervisor = CustomUser.objects.create_user("foreman", password="x")
+        obj = make_object(supervisor, [self.worker])
+        self.client.force_authenticate(supervisor)
+        self.assertEqual(self.client.get(f"/api/v1/object/{obj.id}/qr/").status_code, 200)
+        self.assertEqual(self.client.get(f"/api/v1/object/{self.obj.id}/qr/").status_code, 403)
+
+    def test_admin_action_fills_qr_link(self):
+        self.client.force_login(CustomUser.objects.create_superuser("admin", password="x"))
+        response = self.client.post("/admin/main_app/object/", {
+            "action": "render_qr_codes", "_selected_action": [self.obj.id],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.obj.refresh_from_db()
+        self.assertTrue(self.obj.qr_code.endswith(f"/api/v1/object/{self.obj.id}/qr/?type=png"))
+
+
+class QRSheetTests(QRCacheTestCase):
+    def test_command_renders_pages_in_process_pool(self):
+        for i in range(12):
+            make_object(self.supervisor, [])
+        out_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, out_dir, ignore_errors=True)
+
+        call_command("render_qr_sheets", out_dir, type="png", workers=2, stdout=StringIO())
+        pages = sorted(os.listdir(out_dir))
+        self.assertEqual(pages, ["qr-001.png", "qr-002.png"])
+        with PILImage.open(os.path.join(out_dir, pages[0])) as page:
+            self.assertEqual(page.size, qr_sheets.page_size())
+        # QR-коды нарисованы дочерними процессами через общий кэш
+        self.assertEqual(len(os.listdir(self.qr_dir)), 13)
+
+        pdf = os.path.join(out_dir, "labels.pdf")
+        call_command("render_qr_sheets", pdf, ids=str(self.obj.id), stdout=StringIO())
+        with open(pdf, "rb") as f:
+            self.assertTrue(f.read(5) == b"%PDF-")
+
+
+    @override_settings(QR_SHEET_ADMIN_MAX_PAGES=1)
+    def test_admin_action_is_capped_and_renders_in_process(self):
+        self.client.force_login(CustomUser.objects.create_superuser("admin", password="x"))
+        objects = [make_object(self.supervisor, [], name=f"Объект {i}") for i in range(12)]
+
+        def print_sheets(ids):
+            return self.client.post("/admin/main_app/object/", {
+                "action": "print_qr_sheets", "_selected_action": ids,
+            })
+
+        with mock.patch("main_app.qr_sheets.ProcessPoolExecutor") as pool:
+            response = print_sheets([obj.id for obj in objects[:12]])
+            self.assertEqual(response["Content-Type"], "application/pdf")
+            pool.assert_not_called()
+        response = print_sheets([self.obj.id, *(obj.id for obj in objects)])
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(QR_SHEET_ADMIN_MAX_PAGES=1)
+    def test_admin_render_action_is_capped(self):
+        self.client.force_login(CustomUser.objects.create_superuser("admin", password="x"))
+        objects = [make_object(self.supervisor, [], name=f"Объект {i}") for i in range(12)]
+        with mock.patch.object(qr, "render") as render:
+            response = self.client.post("/admin/main_app/object/", {
+                "action": "render_qr_codes", "_selected_action": [self.obj.id, *(obj.id for obj in objects)],
+            }, follow=True)
+            render.assert_not_called()
+        self.assertIn("rerender_qr_codes", response.content.decode())
+        self.assertFalse(Object.objects.exclude(qr_code=None).exists())
+
+
+class SignedQRCodeTests(QRCacheTestCase):
+    def test_code_is_verified_before_any_query(self):
+        code = qr.sign(self.obj.id)
+        self.assertEqual(qr.verify(code), self.obj.id)
+        self.assertEqual(qr.verify("https://example.com/scan/" + code), self.obj.id)
+
+        url = f"/api/v1/object/status/{self.obj.id}/"
+        self.assertEqual(self.client.get(url, {"code": code}).status_code, 200)
+        forged = code[:-1] + ("A" if code[-1] != "A" else "B")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, {"code": forged}).status_code, 403)
+            other = qr.sign(self.obj.id + 1)
+            self.assertEqual(self.client.get(url, {"code": other}).status_code, 403)
+
+    def test_start_by_code_and_required_mode(self):
+        with override_settings(QR_SIGNED_CODES_REQUIRED=True):
+            url = f"/api/v1/object/status/{self.obj.id}/"
+            self.assertEqual(self.client.get(url).status_code, 403)
+            self.work.end_work()
+            response = self.client.post(
+                "/api/v1/start/", {"code": qr.sign(self.obj.id), "name": "Работа"}, format="json"
+            )
+            self.assertEqual(response.status_code, 201)
+
+    def test_key_rotation_revokes_and_rerenders(self):
+        old_code = qr.sign(self.obj.id)
+        old_path = qr.render(self.obj.id, "png")
+        keys = {1: settings.QR_SIGNING_KEYS[1], 2: "new-key"}
+        with override_settings(QR_SIGNING_KEYS=keys, QR_SIGNING_KEY_VERSION=2):
+            self.assertEqual(qr.verify(old_code), self.obj.id)
+            call_command("rerender_qr_codes", workers=1, stdout=StringIO())
+            self.assertFalse(os.path.exists(old_path))
+            self.assertTrue(qr.payload(self.obj.id).startswith("2."))
+        with override_settings(QR_SIGNING_KEYS={2: "new-key"}, QR_SIGNING_KEY_VERSION=2):
+            self.assertIsNone(qr.verify(old_code))
+
+    @override_settings(QR_SIGNED_CODES_REQUIRED=True)
+    def test_required_mode_covers_sync_and_exempts_batch_status(self):
+        self.work.end_work()
+        caches["active_work"].clear()
+
+        def sync_start(**event):
+            response = self.client.post(
+                "/api/v1/sync/", {"events": [{"type": "start", "name": "Работа", **event}]}, format="json"
+            )
+            return response.data["results"][0]
+
+        self.assertEqual(sync_start(object=self.obj.id)["status"], 403)
+        self.assertEqual(sync_start(code=qr.sign(self.obj.id + 1), object=self.obj.id)["status"], 403)
+        self.assertEqual(sync_start(code=qr.sign(self.obj.id))["status"], 200)
+
+        response = self.client.get("/api/v1/object/status/batch/", {"ids": str(self.obj.id)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["object_id"], self.obj.id)
+
+    def test_secret_key_rotation_keeps_codes(self):
+        code = qr.sign(self.obj.id)
+        with override_settings(SECRET_KEY="new-secret-key", SECRET_KEY_FALLBACKS=[]):
+            self.assertEqual(qr.verify(code), self.obj.id)
+
+    def test_deploy_check_rejects_default_key(self):
+        with override_settings(QR_SIGNING_KEYS={1: "django-insecure-qr-7f3c1a9e5b2d4c8a"}):
+            errors = checks.check_qr_signing_keys(None)
+            self.assertEqual([error.id for error in errors], ["main_app.E001"])
+        with override_settings(QR_SIGNING_KEYS={1: "k" * 50}):
+            self.assertEqual(checks.check_qr_signing_keys(None), [])
+
+
+def make_photo_with_qr(object_id):
+    """Снимок 2400x1800 с QR-кодом объекта в углу"""
+    photo = PILImage.new("RGB", (2400, 1800), "#7a8a6a")
+    with PILImage.open(qr.render(object_id, "png", 600)) as code:
+        photo.paste(code.convert("RGB"), (1500, 900))
+    buffer = BytesIO()
+    photo.save(buffer, "JPEG", quality=85)
+    return SimpleUploadedFile("photo.jpg", buffer.getvalue(), content_type="image/jpeg")
+
+
+@override_settings(QR_PHOTO_VERIFICATION_ENABLED=True, QR_PHOTO_VERIFICATION_ASYNC=False, IMAGE_RENDITIONS_ASYNC=False)
+class PhotoQRVerificationTests(QRCacheTestCase):
+    def upload_checked(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload(image)
+        self.assertEqual(response.status_code, 201)
+        return WorkImage.objects.get(id=response.data["id"])
+
+    def test_upload_records_qr_check(self):
+        other = make_object(self.supervisor, [], name="Другой")
+        self.assertEqual(self.upload_checked(make_photo_with_qr(self.obj.id)).qr_check, photo_qr.VERIFIED)
+        self.assertEqual(self.upload_checked(make_photo_with_qr(other.id)).qr_check, photo_qr.MISMATCH)
+        missing = self.upload_checked(make_jpeg())
+        self.assertEqual(missing.qr_check, photo_qr.MISSING)
+        self.assertIsNotNone(missing.qr_checked_at)
+
+        response = self.client.get(f"/api/v1/image_work/{self.work.id}/list/", {"qr_check": "missing"})
+        self.assertEqual([image["id"] for image in response.data["results"]], [missing.id])
+        response = self.client.get(f"/api/v1/image_work/{self.work.id}/list/", {"qr_check": "bad"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unverified_list_for_reviewers(self):
+        foreman = CustomUser.objects.create_user("foreman", password="x")
+        own = make_object(foreman, [self.worker], name="Свой")
+        self.upload_checked(make_photo_with_qr(self.obj.id))
+        unverified = self.upload_checked(make_jpeg())
+        self.work.end_work()
+        work = Work(object=own, user=self.worker)
+        work.start_work("Работа")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"/api/v1/image_work/{work.id}/", {"image": make_photo_with_qr(self.obj.id)}, format="multipart"
+            )
+        foreign_code = response.data["id"]
+
+        self.client.force_authenticate(self.supervisor)
+        response = self.client.get("/api/v1/image_work/unverified/")
+        self.assertEqual([image["id"] for image in response.data["results"]], [unverified.id, foreign_code])
+        response = self.client.get("/api/v1/image_work/unverified/", {"object": own.id})
+        self.assertEqual([image["qr_check"] for image in response.data["results"]], ["mismatch"])
+
+        self.client.force_authenticate(foreman)
+        response = self.client.get("/api/v1/image_work/unverified/")
+        self.assertEqual([image["id"] for image in response.data["results"]], [foreign_code])
+        self.client.force_authenticate(self.worker)
+        self.assertEqual(self.client.get("/api/v1/image_work/unverified/").data["results"], [])
+
+    @override_settings(QR_PHOTO_VERIFICATION_ENABLED=False)
+    def test_command_checks_old_photos_in_process_pool(self):
+        verified = self.upload_checked(make_photo_with_qr(self.obj.id))
+        missing = self.upload_checked(make_jpeg())
+        self.assertEqual(verified.qr_check, "")
+        call_command("verify_photo_qr", workers=2, stdout=StringIO())
+        verified.refresh_from_db()
+        missing.refresh_from_db()
+        self.assertEqual((verified.qr_check, missing.qr_check), (photo_qr.VERIFIED, photo_qr.MISSING))
+
+
+class AsyncPhotoQRVerificationTests(TransactionTestCase):
+    """submit -> пул процессов -> _store в служебном потоке пула"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        qr_override = override_settings(QR_CACHE_DIR=self.tmp, QR_PHOTO_VERIFICATION_WORKERS=1)
+        qr_override.enable()
+        self.addCleanup(qr_override.disable)
+        self.addCleanup(self.shutdown_executor)
+
+        supervisor = CustomUser.objects.create_user("boss", password="x", is_staff=True)
+        self.obj = make_object(supervisor)
+        work = Work.objects.create(object=self.obj, user=supervisor, start_time=timezone.now())
+        self.image = WorkImage.objects.create(work=work, image="images/photo.jpg")
+        self.path = os.path.join(self.tmp, "photo.jpg")
+        with open(self.path, "wb") as f:
+            f.write(make_photo_with_qr(self.obj.id).read())
+
+    def shutdown_executor(self):
+        if photo_qr._executor is not None:
+            photo_qr._executor.shutdown(wait=True)
+            photo_qr._executor = None
+
+    def wait_for_check(self):
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            self.image.refresh_from_db()
+            if self.image.qr_check:
+                return self.image.qr_check
+            time.sleep(0.1)
+        self.fail("Проверка QR-кода не завершилась")
+
+    def test_submit_stores_result(self):
+        photo_qr.submit(self.image.id, self.path, self.obj.id)
+        self.assertEqual(self.wait_for_check(), photo_qr.VERIFIED)
+
+    def test_broken_pool_is_recreated(self):
+        broken = photo_qr.get_executor()
+        broken.shutdown(wait=True)
+        photo_qr.submit(self.image.id, self.path, self.obj.id)
+        self.assertIsNot(photo_qr._executor, broken)
+        self.assertEqual(self.wait_for_check(), photo_qr.VERIFIED)
@@ -0,0 +1,155 @@
+"""
+Проверка загружаемых фото прямо во время приема multipart-запроса.
+
+WorkImageUploadHandler пишет каждый файл частями во временный файл на
+диске, так что в памяти держится не больше одной части. По ходу приема он:
+    - обрывает запись, как только файл превысил UPLOAD_IMAGE_MAX_SIZE;
+    - считает SHA-256 (blobs.store не перечитывает файл ради хеша);
+    - определяет формат по первым байтам и читает из заголовка размеры,
+      не декодируя пиксели, поэтому бомба-декомпрессия отсекается до
+      Image.open в ImageField и до пережатия.
+Найденная ошибка сохраняется в upload_error файла и возвращается
+валидацией поля image (CheckedImageField) как обычная ошибка поля.
+"""
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Заголовок с размерами обычно в первых килобайтах, EXIF может занять до 64 КБ
+HEADER_MAX_SIZE = 256 * 1024
+
+MAGIC_BYTES = {
+    "JPEG": (b"\xff\xd8\xff",),
+    "PNG": (b"\x89PNG\r\n\x1a\n",),
+    "GIF": (b"GIF87a", b"GIF89a"),
+    "WEBP": (b"RIFF",),
+}
+
+
+def sniff_format(head):
+    for image_format in settings.UPLOAD_IMAGE_FORMATS:
+        if any(head.startswith(magic) for magic in MAGIC_BYTES[image_format]):
+            if image_format == "WEBP" and head[8:12] != b"WEBP":
+                continue
+            return image_format
+    return None
+
+
+class ImageHeader:
+    """Накопитель первых байт файла, пока из них не прочитается заголовок"""
+
+    def __init__(self):
+        self.data = b""
+        self.format = None
+        self.size = None
+        self.error = None
+
+    @property
+    def done(self):
+        return self.size is not None or self.error is not None
+
+    def feed(self, chunk):
+        if self.done:
+            return
+        self.data += chunk[: HEADER_MAX_SIZE - len(self.data)]
+        if self.format is None and len(self.data) >= 12:
+            self.format = sniff_format(self.data)
+            if self.format is None:
+                self.error = "Неподдерживаемый формат файла, допустимы: " + ", ".join(
+                    settings.UPLOAD_IMAGE_FORMATS
+                )
+                return
+        if self.format is None:
+            return
+        try:
+            # Image.open читает только заголовок, пиксели не декодируются
+            with Image.open(BytesIO(self.data), formats=[self.format]) as image:
+                self.size = image.size
+        except Image.DecompressionBombError:
+            self.error = "Слишком большое изображение"
+        except Exception:
+            if len(self.data) >= HEADER_MAX_SIZE:
+                self.error = "Не удалось прочитать заголовок изображения"
+            return
+        else:
+            width, height = self.size
+            if width * height > settings.UPLOAD_IMAGE_MAX_PIXELS:
+                self.error = (
+                    f"Слишком большое изображение: {width}x{height}, "
+                    f"допустимо не больше {settings.UPLOAD_IMAGE_MAX_PIXELS} пикселей"
+                )
+        self.data = b""
+
+    def finish(self):
+        if self.error is None and self.size is None:
+            self.error = "Файл не является изображением или поврежден"
+        return self.error
+
+
+def inspect_file(file):
+    """Та же проверка для файла, принятого без обработчика (докачка), по первым байтам"""
+    header = ImageHeader()
+    file.seek(0)
+    while not header.done:
+        chunk = file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        header.feed(chunk)
+    file.seek(0)
+    return header.finish()
+
+
+class WorkImageUploadHandler(TemporaryFileUploadHandler):
+    chunk_size = UPLOAD_CHUNK_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.digest = hashlib.sha256()
+        self.header = ImageHeader()
+        self.error = None
+
+    def reject(self, error):
+        # Остаток файла не пишется на диск, уже записанное выбрасывается
+        self.error = error
+        self.file.seek(0)
+        self.file.truncate()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.error is not None:
+            return None
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_IMAGE_MAX_SIZE:
+            self.reject(
+                f"Файл больше {settings.UPLOAD_IMAGE_MAX_SIZE // (1024 * 1024)} МБ"
+            )
+            return None
+        self.header.feed(raw_data)
+        if self.header.error is not None:
+            self.reject(self.header.error)
+            return None
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        error = self.error or self.header.finish()
+        if error is not None:
+            file.upload_error = error
+        else:
+            file.sha256 = self.digest.hexdigest()
+            file.image_format = self.header.format
+            file.image_size = self.header.size
+        return file
+
+
+class StreamingImageUploadMixin:
+    """Для APIView, принимающих фото работ в multipart"""
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [WorkImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
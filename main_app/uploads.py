@@ -0,0 +1,112 @@
+"""
+Докачиваемые загрузки фото: сессия -> части с указанием смещения -> завершение.
+
+Часть сначала принимается из сети в отдельный временный файл без
+транзакции и блокировок (медленный клиент не держит строку сессии), затем
+под блокировкой строки смещение проверяется заново и часть дописывается в
+файл сессии в UPLOAD_SESSIONS_DIR. В память попадает не больше
+UPLOAD_READ_BLOCK байт.
+При завершении файл не перечитывается: хранилище переносит его на место
+(FileSystemStorage делает move для файлов с temporary_file_path).
+"""
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from .models import UploadSession
+
+UPLOAD_READ_BLOCK = 64 * 1024
+
+
+class SessionFile(File):
+    """Файл сессии, который хранилище и ImageField берут по пути на диске"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def session_path(session):
+    return os.path.join(settings.UPLOAD_SESSIONS_DIR, f"{session.id}.part")
+
+
+def create_file(session):
+    os.makedirs(settings.UPLOAD_SESSIONS_DIR, exist_ok=True)
+    open(session_path(session), "wb").close()
+
+
+def receive_chunk(session, offset, stream, length):
+    """
+    Читает до length байт из stream во временный файл части, возвращает
+    (путь, число байт). Файл удаляет вызывающий (discard_chunk)
+    """
+    os.makedirs(settings.UPLOAD_SESSIONS_DIR, exist_ok=True)
+    written = 0
+    with tempfile.NamedTemporaryFile(
+        dir=settings.UPLOAD_SESSIONS_DIR, prefix=f"{session.id}.{offset}.", suffix=".chunk", delete=False
+    ) as f:
+        while written < length:
+            block = stream.read(min(UPLOAD_READ_BLOCK, length - written))
+            if not block:
+                break
+            f.write(block)
+            written += len(block)
+    return f.name, written
+
+
+def append_chunk(session, chunk_path):
+    """
+    Дописывает принятую часть с позиции session.offset, вызывать под
+    блокировкой сессии. Недописанный хвост от оборванной части перезаписывается
+    """
+    with open(session_path(session), "r+b") as f, open(chunk_path, "rb") as chunk:
+        f.seek(session.offset)
+        shutil.copyfileobj(chunk, f, UPLOAD_READ_BLOCK)
+        f.truncate()
+
+
+def discard_chunk(chunk_path):
+    try:
+        os.remove(chunk_path)
+    except FileNotFoundError:
+        pass
+
+
+def open_completed(session):
+    return SessionFile(open(session_path(session), "rb"), name=session.filename)
+
+
+def discard(session):
+    try:
+        os.remove(session_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def purge_expired():
+    """Удаляет брошенные сессии и их файлы, возвращает число сессий"""
+    expired_before = timezone.now() - settings.UPLOAD_SESSION_TTL
+    expired = list(UploadSession.objects.filter(updated_at__lt=expired_before))
+    for session in expired:
+        discard(session)
+    UploadSession.objects.filter(id__in=[session.id for session in expired]).delete()
+
+    # Файлы без сессии (например, если сессия удалена каскадом вместе с работой)
+    # и части, брошенные оборванными запросами
+    if os.path.isdir(settings.UPLOAD_SESSIONS_DIR):
+        live = {
+            f"{session_id}.part"
+            for session_id in UploadSession.objects.values_list("id", flat=True)
+        }
+        with os.scandir(settings.UPLOAD_SESSIONS_DIR) as entries:
+            for entry in entries:
+                if (
+                    entry.is_file()
+                    and entry.name not in live
+                    and entry.stat().st_mtime < expired_before.timestamp()
+                ):
+                    os.remove(entry.path)
+    return len(expired)
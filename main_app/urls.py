@@ -1,19 +1,31 @@
 from django.urls import path
-from .views import StartWorkView, EndWorkView, ReviewCreateView, WorksWithoutReviewsView, ObjectStatusView, WorkImageDeleteView,UserWorksWithReviewsAndImagesView, WorkImageDetailView, WorkImageListView, WorkImageUploadView, WorkHistoryView
+from .views import StartWorkView, EndWorkView, ReviewCreateView, WorksWithoutReviewsView, ObjectStatusView, WorkImageDeleteView,UserWorksWithReviewsAndImagesView, WorkImageDetailView, WorkImageListView, WorkImageUploadView, WorkHistoryView, SyncView, ActiveWorkCacheStatsView, ObjectStatusBatchView, WorkHistoryExportView, UploadSessionCreateView, UploadSessionView, UploadSessionFinalizeView, WorkImageBatchUploadView, WorkImageFileView, SignedMediaView, ObjectQRCodeView, UnverifiedWorkImageListView
 from django.conf.urls.static import static
 from django.conf import settings
 
 urlpatterns = [
     path('start/', StartWorkView.as_view(), name='start_work'),
     path('end/', EndWorkView.as_view(), name='end_work'),
+    path('sync/', SyncView.as_view(), name='sync'),
 
 
     path('object/status/<int:object_id>/', ObjectStatusView.as_view(), name='status_object'),
+    path('object/<int:object_id>/qr/', ObjectQRCodeView.as_view(), name='object_qr'),
+    path('object/status/batch/', ObjectStatusBatchView.as_view(), name='status_object_batch'),
     path('object/work-history/<int:object_id>/', WorkHistoryView.as_view(), name='work-history'),
+    path('object/work-history/<int:object_id>/export/', WorkHistoryExportView.as_view(), name='work-history-export'),
+    path('cache/active-work/stats/', ActiveWorkCacheStatsView.as_view(), name='active_work_cache_stats'),
     
     path('image_work/<int:work_id>/', WorkImageUploadView.as_view(), name='image_upload'),
+    path('image_work/<int:work_id>/batch/', WorkImageBatchUploadView.as_view(), name='image_batch_upload'),
+    path('image_work/<int:work_id>/uploads/', UploadSessionCreateView.as_view(), name='upload_session_create'),
+    path('uploads/<uuid:upload_id>/', UploadSessionView.as_view(), name='upload_session'),
+    path('uploads/<uuid:upload_id>/finalize/', UploadSessionFinalizeView.as_view(), name='upload_session_finalize'),
+    path('image_work/unverified/', UnverifiedWorkImageListView.as_view(), name='image_unverified'),
     path('image_work/<int:work_id>/list/', WorkImageListView.as_view(), name='image_list'),
     path('image_work/<int:work_id>/<int:image_id>/', WorkImageDetailView.as_view(), name='image_detail'),
+    path('image_work/<int:work_id>/<int:image_id>/file/', WorkImageFileView.as_view(), name='image_file'),
+    path('media/<path:name>', SignedMediaView.as_view(), name='signed_media'),
     path('image_work/<int:work_id>/<int:pk>/delete/', WorkImageDeleteView.as_view(), name='image_delete'),
 
     path('user/works/', UserWorksWithReviewsAndImagesView.as_view(), name='user-works-with-reviews-and-images'),
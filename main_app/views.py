@@ -1,13 +1,18 @@
+import json
 import stat
+import time
 from xml.dom import NotFoundErr
+from django.db import transaction
+from django.http import FileResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import status, generics, serializers
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.exceptions import PermissionDenied, NotFound
 
 from drf_yasg.utils import swagger_auto_schema
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from .serializers import (
     WorkSerializer,
     ReviewSerializer,
@@ -15,18 +20,26 @@ from .serializers import (
     WorkImageListSerializer,
     StartWorkSerializer,
     EndWorkSerializer,
-    ObjectSerializer,
     StatusResponseSerializer,
     WorkHistorySerializer,
-    WorkWithReviewAndImagesSerializer
+    WorkWithReviewAndImagesSerializer,
+    SyncSerializer,
+    UploadSessionCreateSerializer,
+    UploadSessionSerializer,
 )
-from .models import Work, WorkImage, Object
+from .models import Work, WorkImage, Object, UploadSession
+from django.conf import settings
+from . import access, blobs, export, media, photo_qr, qr, renditions, services, uploads
+from . import active_work as active_work_cache
+from .idempotency import idempotent
+from .pagination import WorkKeysetPagination, WorkImageKeysetPagination
+from .upload_handlers import StreamingImageUploadMixin
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 
 class StartWorkView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, qr.SignedQRCode]
 
     @swagger_auto_schema(
         security=[{"Bearer": []}],
@@ -39,42 +52,20 @@ class StartWorkView(APIView):
             403: "Доступ запрещен",
         },
     )
+    @idempotent
     def post(self, request):
         serializer = StartWorkSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        object_id = serializer.validated_data["object"]
-        name = serializer.validated_data["name"]
-        description = serializer.validated_data["description"]
-        user = request.user
-
-        if Work.objects.filter(user=user, end_time__isnull=True).exists():
-            if Work.objects.filter(
-                user=user, end_time__isnull=True, object=object_id
-            ).exists():
-                return Response(
-                    {"error": "Пользователь уже работает на этом объекте."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            return Response(
-                {"error": "Пользователь уже работает на другом объекте."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
         try:
-            obj = Object.objects.get(id=object_id)
-            if user not in obj.worker.all() and user != obj.supervisor:
-                return Response(
-                    {"error": "Нет прав для работы с этим объектом"},
-                    status=status.HTTP_403_FORBIDDEN,
-                )
-        except Object.DoesNotExist:
-            return Response(
-                {"error": "Объект не найден"}, status=status.HTTP_404_NOT_FOUND
+            work = services.start_work(
+                request.user,
+                serializer.validated_data.get("object") or request.qr_object_id,
+                serializer.validated_data["name"],
+                serializer.validated_data.get("description"),
             )
-
-        work = Work.objects.create(object=obj, user=user)
-        work.start_work(name, description)
+        except services.WorkActionError as e:
+            return Response({"error": e.error}, status=e.status_code)
 
         return Response(
             {"detail": "Работа успешно начата", "work_id": work.id},
@@ -97,14 +88,16 @@ class EndWorkView(APIView):
             404: "Работа не найдена",
         },
     )
+    @idempotent
     def post(self, request):
-        serializer = EndWorkSerializer(data=request.data, context={"request": request})
+        serializer = EndWorkSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        work_id = serializer.validated_data["work_id"]
-        work = Work.objects.get(id=work_id)
+        try:
+            work = services.end_work(request.user, serializer.validated_data["work_id"])
+        except services.WorkActionError as e:
+            return Response({"error": e.error}, status=e.status_code)
 
-        work.end_work()
         return Response(
             {
                 "detail": "Работа успешно завершена",
@@ -116,8 +109,105 @@ class EndWorkView(APIView):
 
 
 
-class ObjectStatusView(APIView):
+class SyncView(StreamingImageUploadMixin, APIView):
     permission_classes = [IsAuthenticated]
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
+
+    @swagger_auto_schema(
+        security=[{"Bearer": []}],
+        tags=["Work"],
+        operation_description=(
+            "Пакетная синхронизация событий, накопленных офлайн. События start, end и image "
+            "применяются по порядку в одной транзакции по тем же правилам, что и отдельные "
+            "запросы. Изображения передаются в multipart-запросе, events - JSON-строкой."
+        ),
+        request_body=SyncSerializer,
+        responses={
+            200: "Результат по каждому событию",
+            400: "Ошибка валидации",
+        },
+    )
+    def post(self, request):
+        events = request.data.get("events")
+        if isinstance(events, str):
+            try:
+                events = json.loads(events)
+            except ValueError:
+                return Response(
+                    {"events": ["Некорректный JSON."]},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        serializer = SyncSerializer(data={"events": events})
+        serializer.is_valid(raise_exception=True)
+
+        results = []
+        refs = {}
+        with transaction.atomic():
+            for index, event in enumerate(serializer.validated_data["events"]):
+                result = {"index": index, "type": event["type"]}
+                if "client_id" in event:
+                    result["client_id"] = event["client_id"]
+                try:
+                    with transaction.atomic():
+                        result.update(self.apply_event(request, event, refs))
+                    result["status"] = status.HTTP_200_OK
+                except services.WorkActionError as e:
+                    result.update({"status": e.status_code, "error": e.error})
+                results.append(result)
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    def start_object(self, event):
+        """ID объекта события start, по подписанному коду так же, как в start/"""
+        code = event.get("code")
+        if not code:
+            if settings.QR_SIGNED_CODES_REQUIRED:
+                raise services.WorkActionError("Нужен подписанный QR-код объекта", status.HTTP_403_FORBIDDEN)
+            return event["object"]
+        object_id = qr.verify(code)
+        if object_id is None or event.get("object") not in (None, object_id):
+            raise services.WorkActionError("Недействительный QR-код", status.HTTP_403_FORBIDDEN)
+        return object_id
+
+    def apply_event(self, request, event, refs):
+        user = request.user
+        timestamp = event.get("timestamp")
+
+        if event["type"] == "start":
+            work = services.start_work(
+                user,
+                self.start_object(event),
+                event["name"],
+                event.get("description"),
+                start_time=timestamp,
+            )
+            if "client_id" in event:
+                refs[event["client_id"]] = work.id
+            return {"work_id": work.id, "start_time": work.start_time}
+
+        work_id = event.get("work_id") or refs.get(event.get("work_ref"))
+        if work_id is None:
+            raise services.WorkActionError("Ссылка на работу не найдена")
+
+        if event["type"] == "end":
+            work = services.end_work(user, work_id, end_time=timestamp)
+            return {"work_id": work.id, "end_time": work.end_time}
+
+        image = request.FILES.get(event["file"])
+        if image is None:
+            raise services.WorkActionError("Файл изображения не передан")
+        work = services.get_open_work(user, work_id)
+        image_serializer = WorkImageSerializer(data={"image": image})
+        if not image_serializer.is_valid():
+            raise services.WorkActionError(image_serializer.errors["image"][0])
+        image = image_serializer.save(work=work)
+        renditions.schedule(image.id)
+        photo_qr.schedule(image)
+        return {"work_id": work.id, "image": image_serializer.data}
+
+
+class ObjectStatusView(APIView):
+    permission_classes = [IsAuthenticated, qr.SignedQRCode]
 
     @swagger_auto_schema(
         security=[{"Bearer": []}],
@@ -129,82 +219,194 @@ class ObjectStatusView(APIView):
                 openapi.IN_PATH,
                 description="ID объекта",
                 type=openapi.TYPE_INTEGER,
-            )
+            ),
+            openapi.Parameter(
+                "code",
+                openapi.IN_QUERY,
+                description="Подписанное содержимое отсканированного QR-кода",
+                type=openapi.TYPE_STRING,
+            ),
         ],
         responses={
             200: openapi.Response(
                 description="Успешный ответ", schema=StatusResponseSerializer
             ),
             404: openapi.Response(description="Объект не найден"),
-            403: openapi.Response(description="Доступ запрещен"),
+            403: openapi.Response(description="Доступ запрещен или недействительный QR-код"),
         },
     )
     def get(self, request, object_id):
         user = request.user
-        response_data = {"status": None, "stats": {}}
-
-        try:
-            obj = Object.objects.get(id=object_id)
-        except Object.DoesNotExist:
+        obj = services.status_queryset(user).filter(id=object_id).first()
+        if obj is None:
             return Response({"status": "not_found"}, status=status.HTTP_404_NOT_FOUND)
 
-        if user not in obj.worker.all() and user != obj.supervisor:
-            return Response({"status": "forbidden"}, status=status.HTTP_403_FORBIDDEN)
+        active_work = active_work_cache.get_active_work(user.id)
+        response_data = services.object_status(user, obj, active_work)
+        if response_data["status"] == "forbidden":
+            return Response(response_data, status=status.HTTP_403_FORBIDDEN)
+        return Response(response_data, status=status.HTTP_200_OK)
 
-        active_work = Work.objects.filter(user=user, end_time__isnull=True).first()
 
-        total_completed = Work.objects.filter(
-            object=obj, start_time__isnull=False, end_time__isnull=False
-        ).count()
+class ObjectStatusBatchView(APIView):
+    permission_classes = [IsAuthenticated]
 
-        user_completed = Work.objects.filter(
-            object=obj, user=user, start_time__isnull=False, end_time__isnull=False
-        ).count()
+    @swagger_auto_schema(
+        security=[{"Bearer": []}],
+        tags=["Object"],
+        operation_description=(
+            "Статусы нескольких объектов одним запросом для панели прораба. "
+            "Каждый элемент имеет тот же формат, что и object/status/{object_id}, "
+            "плюс object_id. Число запросов к базе не зависит от числа объектов. "
+            "Подписанный QR-код не требуется и при QR_SIGNED_CODES_REQUIRED: панель "
+            "ничего не меняет, а по недоступным объектам отдает только forbidden/not_found"
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "ids",
+                openapi.IN_QUERY,
+                description="ID объектов через запятую",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "supervised",
+                openapi.IN_QUERY,
+                description="true - все объекты, где пользователь прораб",
+                type=openapi.TYPE_BOOLEAN,
+            ),
+        ],
+        responses={
+            200: "Список статусов объектов",
+            400: "Неверный запрос",
+        },
+    )
+    def get(self, request):
+        user = request.user
+        limit = settings.STATUS_BATCH_MAX_OBJECTS
 
-        response_data["stats"] = {
-            "total_completed_works": total_completed,
-            "user_completed_works": user_completed,
-        }
-        if active_work:
-            if active_work.object_id != object_id:
-                response_data.update(
-                    {
-                        "status": "busy",
-                        "active_work": WorkSerializer(active_work).data,
-                        "current_object": ObjectSerializer(active_work.object).data,
-                    }
+        if request.query_params.get("supervised") in ("1", "true", "True"):
+            objects = list(
+                services.status_queryset(user)
+                .filter(supervisor=user)
+                .order_by("id")[: limit + 1]
+            )
+            if len(objects) > limit:
+                return Response(
+                    {"error": f"Больше {limit} объектов, передайте ids"},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
-            else:
-                response_data.update(
-                    {
-                        "status": "work",
-                        "object": ObjectSerializer(obj).data,
-                        "work": WorkSerializer(active_work).data,
-                        "available_actions": ["end"],
-                    }
+            object_ids = [obj.id for obj in objects]
+        else:
+            try:
+                object_ids = [
+                    int(value)
+                    for value in request.query_params.get("ids", "").split(",")
+                    if value.strip()
+                ]
+            except ValueError:
+                return Response(
+                    {"error": "ids должны быть целыми числами через запятую"},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
-        elif user.is_staff or user.is_superuser:
-            response_data.update(
-                {
-                    "status": "review",
-                    "object": ObjectSerializer(obj).data,
-                    "available_actions": ["review"],
-                }
-            )
+            if not object_ids:
+                return Response(
+                    {"error": "Передайте ids или supervised=true"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            object_ids = list(dict.fromkeys(object_ids))
+            if len(object_ids) > limit:
+                return Response(
+                    {"error": f"Не больше {limit} объектов за запрос"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            objects = services.status_queryset(user).filter(id__in=object_ids)
+
+        by_id = {obj.id: obj for obj in objects}
+        active_work = active_work_cache.get_active_work(user.id)
+        results = []
+        for object_id in object_ids:
+            obj = by_id.get(object_id)
+            if obj is None:
+                item = {"status": "not_found"}
+            else:
+                item = services.object_status(user, obj, active_work)
+            results.append({"object_id": object_id, **item})
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+class ObjectQRCodeView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        security=[{"Bearer": []}],
+        tags=["Object"],
+        operation_description=(
+            "QR-код объекта в SVG или PNG. Картинка берется из кэша на диске, "
+            "ETag меняется только при смене содержимого кода или размера. "
+            "Доступен персоналу и прорабу объекта"
+        ),
+        manual_parameters=[
+            openapi.Parameter("object_id", openapi.IN_PATH, type=openapi.TYPE_INTEGER, description="ID объекта"),
+            openapi.Parameter(
+                "type", openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(qr.FORMATS),
+                description="svg (по умолчанию) или png",
+            ),
+            openapi.Parameter(
+                "size", openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                description=f"Сторона картинки в пикселях, {settings.QR_MIN_SIZE}-{settings.QR_MAX_SIZE}",
+            ),
+        ],
+        responses={200: "Картинка", 304: "Не изменилась", 403: "Нет доступа к QR-коду объекта", 404: "Объект не найден"},
+    )
+    def get(self, request, object_id):
+        image_format = request.query_params.get("type", "svg")
+        if image_format not in qr.FORMATS:
+            return Response({"error": "Формат должен быть svg или png"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            size = qr.clamp_size(request.query_params.get("size", settings.QR_DEFAULT_SIZE))
+        except ValueError:
+            return Response({"error": "Размер должен быть числом"}, status=status.HTTP_400_BAD_REQUEST)
+
+        obj = Object.objects.filter(id=object_id).values("supervisor_id").first()
+        if obj is None:
+            return Response({"error": "Объект не найден"}, status=status.HTTP_404_NOT_FOUND)
+        # Картинка кода - подтверждение присутствия на объекте (SignedQRCode,
+        # проверка фото), поэтому рабочим ее не отдают, как и в админке
+        if not (request.user.is_staff or obj["supervisor_id"] == request.user.id):
+            return Response({"error": "Нет доступа к QR-коду объекта"}, status=status.HTTP_403_FORBIDDEN)
+
+        etag = qr.etag(object_id, image_format, size)
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"private, max-age={settings.QR_CACHE_MAX_AGE}",
+        }
+        if etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponseNotModified()
         else:
-            response_data.update(
-                {
-                    "status": "start",
-                    "object": ObjectSerializer(obj).data,
-                    "available_actions": ["start"],
-                }
-            )
+            path = qr.render(object_id, image_format, size)
+            response = FileResponse(open(path, "rb"), content_type=qr.FORMATS[image_format])
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+
+class ActiveWorkCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        security=[{"Bearer": []}],
+        tags=["Object"],
+        operation_description="Счетчики попаданий и промахов кэша открытых работ",
+        responses={200: "Статистика кэша", 403: "Доступ запрещен"},
+    )
+    def get(self, request):
+        return Response(active_work_cache.stats(), status=status.HTTP_200_OK)
 
-        return Response(response_data, status=status.HTTP_200_OK)
 
 class WorkHistoryView(generics.ListAPIView):
     serializer_class = WorkWithReviewAndImagesSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = WorkKeysetPagination
 
     @swagger_auto_schema(
         security=[{'Bearer': []}],
@@ -223,22 +425,73 @@ class WorkHistoryView(generics.ListAPIView):
 
     def get_queryset(self):
         object_id = self.kwargs['object_id']
-        
-        works = Work.objects.filter(object_id=object_id)
-        if not works:
-            return []
-        
-        for work in works:
-            work.images = list(WorkImage.objects.filter(work_id=work.id).all())
+        return Work.objects.filter(object_id=object_id).with_review_and_images()
 
-        return works
 
 
 
 
+class WorkHistoryExportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        security=[{"Bearer": []}],
+        tags=["Object"],
+        operation_description=(
+            "Потоковая выгрузка всей истории работ объекта с оценками и ссылками "
+            "на изображения. Доступна staff и прорабу объекта"
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "object_id",
+                openapi.IN_PATH,
+                description="ID объекта",
+                type=openapi.TYPE_INTEGER,
+            ),
+            openapi.Parameter(
+                "type",
+                openapi.IN_QUERY,
+                description="Формат выгрузки: ndjson (по умолчанию) или csv",
+                type=openapi.TYPE_STRING,
+                enum=list(export.FORMATS),
+            ),
+        ],
+        responses={
+            200: "Файл выгрузки",
+            400: "Неизвестный формат",
+            403: "Доступ запрещен",
+            404: "Объект не найден",
+        },
+    )
+    def get(self, request, object_id):
+        export_type = request.query_params.get("type", "ndjson")
+        if export_type not in export.FORMATS:
+            return Response(
+                {"error": "Формат должен быть ndjson или csv"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        supervisor_id = (
+            Object.objects.filter(id=object_id)
+            .values_list("supervisor_id", flat=True)
+            .first()
+        )
+        if supervisor_id is None:
+            return Response({"error": "Объект не найден"}, status=status.HTTP_404_NOT_FOUND)
+        user = request.user
+        if not (user.is_staff or user.is_superuser or user.id == supervisor_id):
+            raise PermissionDenied()
+
+        lines, content_type = export.FORMATS[export_type]
+        response = StreamingHttpResponse(lines(object_id), content_type=content_type)
+        response["Content-Disposition"] = (
+            f'attachment; filename="object-{object_id}-works.{export_type}"'
+        )
+        return response
+
 
 # work images
-class WorkImageUploadView(generics.CreateAPIView):
+class WorkImageUploadView(StreamingImageUploadMixin, generics.CreateAPIView):
     serializer_class = WorkImageSerializer
     parser_classes = (MultiPartParser, FormParser)
     permission_classes = [IsAuthenticated]
@@ -262,25 +515,308 @@ class WorkImageUploadView(generics.CreateAPIView):
             404: "Работа не найдена",
         },
     )
+    @idempotent
     def post(self, request, *args, **kwargs):
         return super().post(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        work_id = self.kwargs["work_id"]
         try:
-            work = Work.objects.get(
-                id=work_id, user=self.request.user, end_time__isnull=True
+            work = services.get_open_work(self.request.user, self.kwargs["work_id"])
+        except services.WorkActionError as e:
+            raise serializers.ValidationError(e.error)
+        image = serializer.save(work=work)
+        renditions.schedule(image.id)
+        photo_qr.schedule(image)
+
+
+class WorkImageBatchUploadView(StreamingImageUploadMixin, APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = (MultiPartParser, FormParser)
+
+    @swagger_auto_schema(
+        security=[{"Bearer": []}],
+        tags=["Work Images"],
+        operation_description=(
+            "Загрузка нескольких изображений к работе одним запросом (поле images, "
+            "повторяется для каждого файла). Результат по каждому файлу: 201 - все "
+            "загружены, 207 - часть файлов не прошла проверку, 400 - ни один"
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "work_id",
+                openapi.IN_PATH,
+                description="ID работы",
+                type=openapi.TYPE_INTEGER,
+            ),
+            openapi.Parameter(
+                "images",
+                openapi.IN_FORM,
+                description="Файлы изображений",
+                type=openapi.TYPE_FILE,
+                required=True,
+            ),
+        ],
+        responses={
+            201: "Все изображения загружены",
+            207: "Загружена часть изображений",
+            400: "Ошибка валидации",
+        },
+    )
+    @idempotent
+    def post(self, request, work_id):
+        files = request.FILES.getlist("images")
+        if not files:
+            return Response(
+                {"error": "Нужно передать хотя бы один файл в поле images"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(files) > settings.IMAGE_BATCH_MAX_FILES:
+            return Response(
+                {"error": f"Не больше {settings.IMAGE_BATCH_MAX_FILES} файлов за запрос"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            work = services.get_open_work(request.user, work_id)
+        except services.WorkActionError as e:
+            return Response({"error": e.error}, status=e.status_code)
+
+        results = []
+        images = []
+        for index, upload in enumerate(files):
+            result = {"index": index, "filename": upload.name}
+            serializer = WorkImageSerializer(data={"image": upload})
+            if serializer.is_valid():
+                image = WorkImage(work=work, **serializer.validated_data)
+                # Файл пишется в хранилище сразу, строки вставляются одним запросом
+                blobs.store(image)
+                images.append((result, image))
+                result["status"] = status.HTTP_201_CREATED
+            else:
+                result.update({"status": status.HTTP_400_BAD_REQUEST, "errors": serializer.errors})
+            results.append(result)
+
+        WorkImage.objects.bulk_create([image for _, image in images])
+        for result, image in images:
+            result["image"] = WorkImageSerializer(image).data
+            renditions.schedule(image.id)
+            photo_qr.schedule(image)
+
+        if not images:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif len(images) < len(files):
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response({"work_id": work.id, "results": results}, status=response_status)
+
+
+class UploadSessionCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        security=[{"Bearer": []}],
+        tags=["Work Images"],
+        operation_description=(
+            "Начало докачиваемой загрузки изображения. Дальше части файла "
+            "отправляются PUT на uploads/{upload_id}/ с заголовком Upload-Offset, "
+            "после последней части - POST uploads/{upload_id}/finalize/"
+        ),
+        request_body=UploadSessionCreateSerializer,
+        responses={
+            201: UploadSessionSerializer,
+            400: "Ошибка валидации",
+        },
+    )
+    def post(self, request, work_id):
+        serializer = UploadSessionCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            work = services.get_open_work(request.user, work_id)
+        except services.WorkActionError as e:
+            return Response({"error": e.error}, status=e.status_code)
+
+        session = UploadSession(user=request.user, work=work, **serializer.validated_data)
+        uploads.create_file(session)
+        session.save()
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
+class UploadSessionView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get_session(self, request, upload_id, lock=False):
+        sessions = UploadSession.objects.filter(id=upload_id, user=request.user)
+        if lock:
+            sessions = sessions.select_for_update()
+        session = sessions.first()
+        if session is None:
+            raise NotFound("Сессия загрузки не найдена")
+        return session
+
+    @swagger_auto_schema(
+        security=[{"Bearer": []}],
+        tags=["Work Images"],
+        operation_description="Сколько байт уже получено, с этого смещения продолжать загрузку",
+        responses={200: UploadSessionSerializer, 404: "Сессия не найдена"},
+    )
+    def get(self, request, upload_id):
+        session = self.get_session(request, upload_id)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        security=[{"Bearer": []}],
+        tags=["Work Images"],
+        operation_description=(
+            "Часть файла в теле запроса (application/octet-stream). Заголовок "
+            "Upload-Offset должен совпадать с уже полученным числом байт"
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "Upload-Offset",
+                openapi.IN_HEADER,
+                description="Смещение части в файле",
+                type=openapi.TYPE_INTEGER,
+                required=True,
+            )
+        ],
+        responses={
+            200: UploadSessionSerializer,
+            400: "Неверная часть",
+            404: "Сессия не найдена",
+            409: "Смещение не совпадает, в ответе текущее смещение",
+        },
+    )
+    def put(self, request, upload_id):
+        try:
+            offset = int(request.headers["Upload-Offset"])
+            length = int(request.headers.get("Content-Length") or 0)
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "Нужны заголовки Upload-Offset и Content-Length"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+            return Response(
+                {"error": f"Часть больше {settings.UPLOAD_CHUNK_MAX_SIZE} байт"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        session = self.get_session(request, upload_id)
+        error = self.check_offset(session, offset, length)
+        if error is not None:
+            return error
+
+        # Тело читается из сети без транзакции и блокировки строки сессии
+        chunk_path, written = uploads.receive_chunk(session, offset, request.stream, length)
+        try:
+            with transaction.atomic():
+                session = self.get_session(request, upload_id, lock=True)
+                error = self.check_offset(session, offset, length)
+                if error is not None:
+                    return error
+                uploads.append_chunk(session, chunk_path)
+                session.offset += written
+                session.updated_at = timezone.now()
+                session.save(update_fields=["offset", "updated_at"])
+        finally:
+            uploads.discard_chunk(chunk_path)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+    def check_offset(self, session, offset, length):
+        if offset != session.offset:
+            return Response(
+                {"error": "Неверное смещение", "offset": session.offset},
+                status=status.HTTP_409_CONFLICT,
             )
-            serializer.save(work=work)
-        except Work.DoesNotExist:
-            raise serializers.ValidationError(
-                "Работа не найдена или недоступна для добавления изображений"
+        if offset + length > session.total_size:
+            return Response(
+                {"error": "Часть выходит за размер файла"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return None
+
+    @swagger_auto_schema(
+        security=[{"Bearer": []}],
+        tags=["Work Images"],
+        operation_description="Отмена загрузки",
+        responses={204: "Удалено", 404: "Сессия не найдена"},
+    )
+    def delete(self, request, upload_id):
+        with transaction.atomic():
+            # Блокировка: отмена не удалит файл, который сейчас прикрепляет finalize
+            session = self.get_session(request, upload_id, lock=True)
+            session.delete()
+            transaction.on_commit(lambda: uploads.discard(session))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadSessionFinalizeView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        security=[{"Bearer": []}],
+        tags=["Work Images"],
+        operation_description="Завершение загрузки: файл прикрепляется к работе",
+        responses={
+            201: WorkImageSerializer,
+            400: "Файл загружен не полностью или не является изображением",
+            404: "Сессия не найдена",
+        },
+    )
+    def post(self, request, upload_id):
+        # Сессия забирается под блокировкой: повторный finalize или отмена ждут
+        # и после коммита уже не находят ее
+        with transaction.atomic():
+            session = (
+                UploadSession.objects.select_for_update()
+                .filter(id=upload_id, user=request.user)
+                .first()
             )
+            if session is None:
+                raise NotFound("Сессия загрузки не найдена")
+            if session.offset != session.total_size:
+                return Response(
+                    {"error": "Файл загружен не полностью", "offset": session.offset},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            try:
+                work = services.get_open_work(request.user, session.work_id)
+            except services.WorkActionError as e:
+                return Response({"error": e.error}, status=e.status_code)
+
+            with uploads.open_completed(session) as image:
+                serializer = WorkImageSerializer(data={"image": image})
+                serializer.is_valid(raise_exception=True)
+                instance = serializer.save(work=work)
+            session.delete()
+            transaction.on_commit(lambda: uploads.discard(session))
+            renditions.schedule(instance.id)
+            photo_qr.schedule(instance)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+QR_CHECK_PARAMETER = openapi.Parameter(
+    "qr_check",
+    openapi.IN_QUERY,
+    description="Результат проверки QR-кода на фото: verified, mismatch, missing, failed, пусто - не проверено",
+    type=openapi.TYPE_STRING,
+)
+
+
+class QRCheckFilterMixin:
+    def filter_qr_check(self, queryset):
+        qr_check = self.request.query_params.get("qr_check")
+        if qr_check is None:
+            return queryset
+        if qr_check not in dict(WorkImage.QR_CHECK_CHOICES):
+            raise serializers.ValidationError({"qr_check": "Неизвестный результат проверки"})
+        return queryset.filter(qr_check=qr_check)
 
 
-class WorkImageListView(generics.ListAPIView):
+class WorkImageListView(QRCheckFilterMixin, generics.ListAPIView):
     serializer_class = WorkImageListSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = WorkImageKeysetPagination
 
     @swagger_auto_schema(
         security=[{"Bearer": []}],
@@ -292,7 +828,8 @@ class WorkImageListView(generics.ListAPIView):
                 openapi.IN_PATH,
                 description="ID работы",
                 type=openapi.TYPE_INTEGER,
-            )
+            ),
+            QR_CHECK_PARAMETER,
         ],
         responses={
             200: WorkImageListSerializer(many=True),
@@ -307,14 +844,50 @@ class WorkImageListView(generics.ListAPIView):
         work_id = self.kwargs["work_id"]
         work = Work.objects.get(id=work_id)
 
-        if not (
-            self.request.user.is_staff
-            or self.request.user.is_superuser
-            or work.user == self.request.user
-        ):
+        if not access.can_view_work(self.request.user, work.user_id):
             raise PermissionDenied()
 
-        return WorkImage.objects.filter(work_id=work_id)
+        return self.filter_qr_check(WorkImage.objects.filter(work_id=work_id))
+
+
+class UnverifiedWorkImageListView(QRCheckFilterMixin, generics.ListAPIView):
+    """Фото без подтвержденного QR-кода объекта, от старых к новым"""
+    serializer_class = WorkImageListSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = WorkImageKeysetPagination
+
+    @swagger_auto_schema(
+        security=[{"Bearer": []}],
+        tags=["Work Images"],
+        operation_description=(
+            "Фото, на которых не подтвержден QR-код объекта работы. Администраторы "
+            "видят все фото, прорабы - фото своих объектов"
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "object",
+                openapi.IN_QUERY,
+                description="ID объекта",
+                type=openapi.TYPE_INTEGER,
+            ),
+            QR_CHECK_PARAMETER,
+        ],
+        responses={200: WorkImageListSerializer(many=True), 400: "Неверные параметры"},
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = WorkImage.objects.exclude(qr_check=photo_qr.VERIFIED)
+        if not (user.is_staff or user.is_superuser):
+            queryset = queryset.filter(work__object__supervisor_id=user.id)
+        object_id = self.request.query_params.get("object")
+        if object_id:
+            if not object_id.isdigit():
+                raise serializers.ValidationError({"object": "Неверный ID объекта"})
+            queryset = queryset.filter(work__object_id=object_id)
+        return self.filter_qr_check(queryset)
 
 
 class WorkImageDetailView(generics.RetrieveAPIView):
@@ -354,16 +927,90 @@ class WorkImageDetailView(generics.RetrieveAPIView):
             work = Work.objects.get(id=work_id)
             image = WorkImage.objects.get(id=image_id, work_id=work_id)
 
-            if not (
-                self.request.user.is_staff
-                or self.request.user.is_superuser
-                or work.user == self.request.user
-            ):
+            if not access.can_view_work(self.request.user, work.user_id):
                 raise PermissionDenied()
 
             return image
         raise NotFound()
 
+
+class WorkImageFileView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        security=[{"Bearer": []}],
+        tags=["Work Images"],
+        operation_description=(
+            "Файл изображения с проверкой прав (как у получения информации об "
+            "изображении). За nginx передача файла отдается ему через X-Accel-Redirect"
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "work_id",
+                openapi.IN_PATH,
+                description="ID работы",
+                type=openapi.TYPE_INTEGER,
+            ),
+            openapi.Parameter(
+                "image_id",
+                openapi.IN_PATH,
+                description="ID изображения",
+                type=openapi.TYPE_INTEGER,
+            ),
+            openapi.Parameter(
+                "rendition",
+                openapi.IN_QUERY,
+                description="Копия: thumb, medium или original (по умолчанию)",
+                type=openapi.TYPE_STRING,
+            ),
+        ],
+        responses={200: "Файл изображения", 403: "Доступ запрещен", 404: "Не найдено"},
+    )
+    def get(self, request, work_id, image_id):
+        # Один запрос: путь к файлу, копии и исполнитель работы
+        row = (
+            WorkImage.objects.filter(id=image_id, work_id=work_id)
+            .values_list("image", "renditions", "work__user_id")
+            .first()
+        )
+        if row is None or not row[0]:
+            raise NotFound()
+        name, image_renditions, owner_id = row
+        if not access.can_view_work(request.user, owner_id):
+            raise PermissionDenied()
+
+        rendition = request.query_params.get("rendition", "original")
+        if rendition != "original" and rendition not in settings.IMAGE_RENDITIONS:
+            raise NotFound()
+        # Права на файл проверяются при каждом запросе, срок кэша как у подписанной ссылки
+        return media.cache_immutable(
+            media.file_response((image_renditions or {}).get(rendition, name)), settings.MEDIA_URL_TTL
+        )
+
+class SignedMediaView(APIView):
+    # Доступ проверен при выдаче ссылки, здесь только подпись: ни пользователя, ни запросов к базе
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(
+        tags=["Work Images"],
+        operation_description=(
+            "Файл по подписанной ссылке из поля image/renditions. Ссылка действует "
+            "до expires, права повторно не проверяются"
+        ),
+        manual_parameters=[
+            openapi.Parameter("expires", openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=True),
+            openapi.Parameter("signature", openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True),
+        ],
+        responses={200: "Файл", 403: "Неверная или просроченная подпись"},
+    )
+    def get(self, request, name):
+        expires = request.query_params.get("expires")
+        if not media.verify(name, expires, request.query_params.get("signature")):
+            raise PermissionDenied("Неверная или просроченная ссылка")
+        return media.cache_immutable(media.file_response(name), int(expires) - int(time.time()))
+
+
 class WorkImageDeleteView(generics.DestroyAPIView):
     queryset = WorkImage.objects.all()
     permission_classes = [IsAuthenticated]
@@ -395,9 +1042,10 @@ class WorkImageDeleteView(generics.DestroyAPIView):
 
     def perform_destroy(self, instance):
         work = instance.work
-        if work.end_time is not None or work.user != self.request.user:
+        if work.end_time is not None or work.user_id != self.request.user.id:
             raise PermissionDenied("Нельзя удалять изображения завершенной работы")
         instance.delete()
+        blobs.release(instance)
 
 
 
@@ -412,6 +1060,7 @@ class ReviewCreateView(APIView):
         request_body=ReviewSerializer,
         responses={200: "Оценка успешно оставлена", 400: "Ошибка валидации"},
     )
+    @idempotent
     def post(self, request, work_id):
         work = Work.objects.filter(id=work_id).first()
         
@@ -451,12 +1100,15 @@ class WorksWithoutReviewsView(APIView):
     )
     def get(self, request):
         if request.user.is_staff:
-            works_without_reviews = Work.objects.filter(review__isnull=True)
-            if not works_without_reviews:
+            paginator = WorkKeysetPagination()
+            works_without_reviews = paginator.paginate_queryset(
+                Work.objects.filter(review__isnull=True), request, view=self
+            )
+            if not works_without_reviews and not paginator.has_cursor:
                 return Response({"error": "Работы без отзывов не найдены."}, status=404)
-            
+
             serializer = WorkSerializer(works_without_reviews, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return paginator.get_paginated_response(serializer.data)
         return Response({"error": "У пользователя нет доступа к этому методу"}, status=status.HTTP_403_FORBIDDEN)
     
 class UserWorksWithReviewsAndImagesView(APIView):
@@ -469,35 +1121,14 @@ class UserWorksWithReviewsAndImagesView(APIView):
         responses={200: "Список работ с оценками и фотографиями", 404: "Работы не найдены"},
     )
     def get(self, request):
-        # Получаем все работы пользователя
-        user = request.user
-        works = Work.objects.filter(user=user)
-
-        if not works:
-            return Response({"error": "Работы не найдены."}, status=status.HTTP_404_NOT_FOUND)
-
-        # Сериализуем работы с оценками и изображениями
-        serializer = WorkWithReviewAndImagesSerializer(works, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
-
-
-class UserWorksWithReviewsAndImagesView(APIView):
-    permission_classes = [IsAuthenticated]
-
-    @swagger_auto_schema(
-        security=[{"Bearer": []}],
-        tags=["Work"],
-        operation_description="Получение всех работ пользователя с оценками и фотографиями",
-        responses={200: "Список работ с оценками и фотографиями", 404: "Работы не найдены"},
-    )
-    def get(self, request):
-        user = request.user
-        works = Work.objects.filter(user=user)
-        if not works:
+        paginator = WorkKeysetPagination()
+        works = paginator.paginate_queryset(
+            Work.objects.filter(user=request.user).with_review_and_images(),
+            request,
+            view=self,
+        )
+        if not works and not paginator.has_cursor:
             return Response({"error": "Работы не найдены."}, status=status.HTTP_404_NOT_FOUND)
-        
-        for work in works:
-            work.images = list(WorkImage.objects.filter(work_id=work.id).all())
 
         serializer = WorkWithReviewAndImagesSerializer(works, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return paginator.get_paginated_response(serializer.data)
\ No newline at end of file